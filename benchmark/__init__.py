@@ -0,0 +1,16 @@
+"""
+Benchmarks for sentimentube.
+
+Run a benchmark from the repository root as a module, e.g.:
+
+    python -m benchmark.bench_startup
+
+The sentimentube modules import each other as top-level modules, so the
+package directory is put on the path here, like nose-pathmunge does for
+the tests.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, "sentimentube"))
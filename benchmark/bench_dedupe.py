@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of removing repeated comments from the scraped pages.
+
+Compares the old de-duplication, which searched the list once per unique
+id, with the single pass over the pages that YouTubeScraper now makes.
+The pages repeat the last comments of the page before, like the gdata
+pages do when comments are posted while paging.
+"""
+import argparse
+import time
+from unittest import mock
+
+import youtube
+from benchmark import synthetic
+
+
+def make_pages(comments, overlap=5):
+    """
+    Split comments into gdata sized pages that overlap.
+
+    :param comments: list of Comment objects
+    :param overlap: number of comments repeated from the page before
+    :return: list of pages, each a list of Comment objects
+    """
+    step = youtube.PAGE_SIZE - overlap
+    return [comments[max(start - overlap, 0):start + step]
+            for start in range(0, len(comments), step)]
+
+
+def dedupe_quadratic(pages):
+    """
+    Remove repeated comments the old way.
+
+    :param pages: list of pages of comments
+    :return: list of unique comments
+    """
+    comments = [comment for page in pages for comment in page]
+    unique_ids = set([comment.id for comment in comments])
+    return [next(com for com in comments if com.id == com_id)
+            for com_id in unique_ids]
+
+
+def dedupe_scraper(pages):
+    """
+    Remove repeated comments with YouTubeScraper.fetch_comments.
+
+    :param pages: list of pages of comments
+    :return: list of unique comments
+    """
+    feeds = [{"entry": page} for page in pages]
+    scraper = youtube.YouTubeScraper()
+    with mock.patch.object(scraper, "_feed_generator",
+                           return_value=iter(feeds)), \
+            mock.patch.object(scraper, "extract_comment",
+                              side_effect=lambda entry, video_id: entry):
+        return scraper.fetch_comments("benchmarkvid")
+
+
+def main():
+    """ Run the de-duplication benchmark and print the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 2000, 4000, 8000],
+                        help="numbers of unique comments")
+    args = parser.parse_args()
+
+    for number in args.sizes:
+        pages = make_pages(synthetic.make_comments(number))
+        for dedupe in (dedupe_quadratic, dedupe_scraper):
+            start = time.perf_counter()
+            comments = dedupe(pages)
+            seconds = time.perf_counter() - start
+            assert len(comments) == number
+            print("{:>7} comments {:<17} {:8.4f} s ({:6.2f} us/comment)"
+                  .format(number, dedupe.__name__, seconds,
+                          seconds / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of storing comments and comment sentiments.
+
+Compares the bulk INSERT OR IGNORE path with checking and adding the
+comments one by one, both for new comments and for a refresh where every
+comment is already stored.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import database
+import models
+from benchmark import synthetic
+
+
+def store_one_by_one(objects):
+    """
+    Store objects with one existence query per object.
+
+    :param objects: list of objects of the same model
+    """
+    model = type(objects[0])
+    for obj in objects:
+        if not database.DB_SESSION.query(model).filter(
+                model.id == obj.id).first():
+            database.DB_SESSION.add(obj)
+    database.DB_SESSION.commit()
+
+
+def store_bulk(objects):
+    """
+    Store objects with INSERT OR IGNORE.
+
+    :param objects: list of objects of the same model
+    """
+    database.insert_or_ignore(objects)
+    database.DB_SESSION.commit()
+
+
+def run(number, store, directory):
+    """
+    Time storing number comments and sentiments with a store function.
+
+    :param number: number of comments
+    :param store: the store function
+    :param directory: directory of the database file
+    :return: tuple of seconds for new and for already stored comments
+    """
+    synthetic.use_database("sqlite:///{}".format(os.path.join(
+        directory, "{}-{}.db".format(store.__name__, number))))
+    timings = []
+    for _ in range(2):
+        comments = synthetic.make_comments(number)
+        sentiments = [models.CommentSentiment(id=comment.id,
+                                              video_id=comment.video_id,
+                                              positive=i % 2)
+                      for i, comment in enumerate(comments)]
+        start = time.perf_counter()
+        store(comments)
+        store(sentiments)
+        timings.append(time.perf_counter() - start)
+        database.DB_SESSION.remove()
+    return tuple(timings)
+
+
+def main():
+    """ Run the persistence benchmark and print the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 50000],
+                        help="numbers of comments")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for number in args.sizes:
+            for store in (store_one_by_one, store_bulk):
+                new, stored = run(number, store, directory)
+                print("{:>7} comments {:<17} new: {:7.3f} s "
+                      "({:>9.0f} comments/s)  already stored: {:7.3f} s"
+                      .format(number, store.__name__, new, number / new,
+                              stored))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of SentimentAnalysis startup.
+
+Measures the cold path, where there is no model file and the classifier is
+trained from the corpus and saved, and the warm path, where the saved model
+file is loaded.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import sentiment_analysis
+
+
+def time_startup(file_path):
+    """
+    Time the creation of a SentimentAnalysis.
+
+    :param file_path: Path of the model file
+    :return: Seconds it took
+    """
+    start = time.perf_counter()
+    sentiment_analysis.SentimentAnalysis(file_path)
+    return time.perf_counter() - start
+
+
+def main():
+    """ Run the startup benchmark and print the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="number of warm startups to time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "classifier.model")
+        cold = time_startup(file_path)
+        warm = [time_startup(file_path) for _ in range(args.repeat)]
+
+    print("cold startup (train and save): {:.3f} s".format(cold))
+    print("warm startup (load model file): {:.4f} s median, {:.4f} s min "
+          "over {} runs".format(statistics.median(warm), min(warm),
+                                args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark against the local gdata stand-in.
+
+Measures comments per second for scraping the comment feeds, classifying
+the comments and persisting them, and videos per second for the /video
+page analysing new videos end to end.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmark import gdata_server, synthetic
+import analysis
+import database
+import models
+import sentiment_analysis
+import youtube
+
+
+def report(name, seconds, videos, comments):
+    """
+    Print the throughput of a stage.
+
+    :param name: name of the stage
+    :param seconds: seconds the stage took
+    :param videos: number of videos
+    :param comments: number of comments
+    """
+    print("{:<10} {:8.3f} s {:8.2f} videos/s {:10.0f} comments/s".format(
+        name, seconds, videos / seconds, comments / seconds))
+
+
+def bench_stages(base_url, video_ids, concurrency):
+    """
+    Measure scraping, classifying and persisting one video at a time.
+
+    :param base_url: base url of the gdata stand-in
+    :param video_ids: list of video ids
+    :param concurrency: comment pages fetched at a time
+    """
+    scraper = youtube.YouTubeScraper(concurrency=concurrency,
+                                     base_url=base_url)
+    start = time.perf_counter()
+    scraped = []
+    for video_id in video_ids:
+        video_info, categories = scraper.fetch_videoinfo(video_id)
+        scraped.append((video_id, video_info, categories,
+                        scraper.fetch_comments(video_id)))
+    num_comments = sum(len(item[3]) for item in scraped)
+    report("scrape", time.perf_counter() - start, len(video_ids),
+           num_comments)
+
+    analyzer = sentiment_analysis.SentimentAnalysis("data/classifier.model")
+    start = time.perf_counter()
+    for item in scraped:
+        analyzer.classify_comment_sentiments(item[3])
+    report("classify", time.perf_counter() - start, len(video_ids),
+           num_comments)
+
+    start = time.perf_counter()
+    for item in scraped:
+        analysis.store_comments(*item)
+    report("persist", time.perf_counter() - start, len(video_ids),
+           num_comments)
+
+
+def bench_video_page(base_url, video_ids, concurrency):
+    """
+    Measure the /video page analysing new videos inside the request.
+
+    :param base_url: base url of the gdata stand-in
+    :param video_ids: list of video ids
+    :param concurrency: comment pages fetched at a time
+    """
+    import webserve
+    webserve.APP.config["BACKGROUND_JOBS"] = False
+    webserve.SCRAPER = youtube.YouTubeScraper(concurrency=concurrency,
+                                              base_url=base_url)
+    client = webserve.APP.test_client()
+    start = time.perf_counter()
+    for video_id in video_ids:
+        response = client.get("/video?video_id={}".format(video_id))
+        assert "Analysis of video with ID" in response.data.decode("utf-8")
+    report("/video", time.perf_counter() - start, len(video_ids),
+           database.DB_SESSION.query(models.Comment).count())
+
+
+def main():
+    """ Run the throughput benchmark and print the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--videos", type=int, default=10,
+                        help="number of videos")
+    parser.add_argument("--pages", type=int, default=20,
+                        help="comment pages per video")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds every gdata response is delayed")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="comment pages fetched at a time")
+    args = parser.parse_args()
+
+    with gdata_server.GDataServer(pages=args.pages,
+                                  latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        print("{} videos of {} comments, {} s latency, concurrency {}".format(
+            args.videos, args.pages * server.page_size, args.latency,
+            args.concurrency))
+        synthetic.use_database("sqlite:///{}".format(
+            os.path.join(directory, "stages.db")))
+        bench_stages(server.base_url, ["stage{}".format(i)
+                                       for i in range(args.videos)],
+                     args.concurrency)
+        database.DB_SESSION.remove()
+        synthetic.use_database("sqlite:///{}".format(
+            os.path.join(directory, "video.db")))
+        bench_video_page(server.base_url, ["page{}".format(i)
+                                           for i in range(args.videos)],
+                         args.concurrency)
+        print("{} gdata requests".format(server.requests))
+
+
+if __name__ == "__main__":
+    main()
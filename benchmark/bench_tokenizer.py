@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of tokenizing texts.
+
+Compares tokenizer.tokenize_many with the tokenizing done before it, which
+looked every word up in the list of nltk stop words and lowercased it
+twice, on the texts of synthetic comments.
+"""
+import argparse
+import time
+
+from nltk.corpus import stopwords
+
+from benchmark import synthetic
+import tokenizer
+
+
+def tokenize_list(texts):
+    """
+    Tokenize texts with the list of stop words, the old way.
+
+    :param texts: list of texts
+    :return: list with the list of words of each text
+    """
+    stop = stopwords.words('english')
+    return [[i.lower() for i in text.split() if not i.lower() in stop]
+            for text in texts]
+
+
+def main():
+    """ Run the tokenizer benchmark and print the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="numbers of texts")
+    args = parser.parse_args()
+
+    tokenizer.stop_words()
+    for number in args.sizes:
+        texts = [comment.content
+                 for comment in synthetic.make_comments(number)]
+        tokens = sum(len(text.split()) for text in texts)
+        for tokenize in (tokenize_list, tokenizer.tokenize_many):
+            start = time.perf_counter()
+            tokenize(texts)
+            seconds = time.perf_counter() - start
+            print("{:>7} texts {:<14} {:8.4f} s {:12.0f} tokens/s".format(
+                number, tokenize.__name__, seconds, tokens / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the gdata youtube API.
+
+Serves the video entries and the paged comment feeds YouTubeScraper reads,
+in the same JSON shape, so scraping and the webservice can be measured
+without the network. The feeds are synthetic: every video has
+pages * page_size comments made from the lines of the training corpus. A
+directory of recordings can add videos with real feeds, one
+<video_id>.json file per video holding {"video": <the json of the video
+feed>, "comments": [<comment entries, newest first>]}.
+
+Run it, and point the webservice or batch.py at it:
+
+    python -m benchmark.gdata_server --port 8080 --latency 0.05
+    SENTIMENTUBE_GDATA_URL=http://localhost:8080/feeds/api/videos \\
+        python webserve.py
+"""
+import argparse
+import datetime
+import http.server
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+from benchmark import synthetic
+
+PREFIX = "/feeds/api/videos/"
+
+
+def video_feed(video_id, num_of_comments):
+    """
+    Return the json of the synthetic video feed of a video.
+
+    :param video_id: the id of the video
+    :param num_of_comments: the comment count of the video
+    :return: dictionary in the shape of the gdata video feed
+    """
+    return {"entry": {
+        "title": {"$t": "synthetic video {}".format(video_id)},
+        "author": [{"name": {"$t": "author"}, "yt$userId": {"$t": "author"}}],
+        "published": {"$t": "2015-01-01T00:00:00.000Z"},
+        "yt$statistics": {"viewCount": "1000"},
+        "gd$rating": {"average": 4.5, "numRaters": 100},
+        "yt$rating": {"numLikes": "90", "numDislikes": "10"},
+        "gd$comments": {"gd$feedLink": {"countHint": num_of_comments}},
+        "yt$accessControl": [{"action": "comment", "permission": "allowed"}],
+        "media$group": {"media$category": [{"$t": "Music"}],
+                        "media$content": [{"duration": 213}]}}}
+
+
+def comment_entries(video_id, number, texts):
+    """
+    Return synthetic comment entries of a video, newest first.
+
+    :param video_id: the id of the video
+    :param number: the number of comments
+    :param texts: the texts to choose the contents from
+    :return: list of dictionaries in the shape of gdata comment entries
+    """
+    rand = random.Random(video_id)
+    start = datetime.datetime(2015, 1, 1)
+    return [{"id": {"$t": "tag:youtube.com,2008:video:{}:comment:{}".format(
+                video_id, number - i)},
+             "author": [{"name": {"$t": "author {}".format(i % 97)},
+                         "yt$userId": {"$t": "user{}".format(i % 97)}}],
+             "content": {"$t": rand.choice(texts)},
+             "published": {"$t": (start + datetime.timedelta(
+                 minutes=number - i)).strftime("%Y-%m-%dT%H:%M:%S.000Z")}}
+            for i in range(number)]
+
+
+class GDataServer:
+
+    """ Class for a threaded HTTP server standing in for gdata. """
+
+    def __init__(self, pages=10, page_size=50, latency=0.0, recordings=None,
+                 host="127.0.0.1", port=0):
+        """
+        Set up the server, it is started by start.
+
+        :param pages: number of comment pages of a synthetic video
+        :param page_size: comments per page if a request does not ask for
+                          a number with max-results
+        :param latency: seconds every response is delayed
+        :param recordings: directory of recorded videos
+        :param host: host to listen on
+        :param port: port to listen on (0 = any free port)
+        """
+        self.pages = pages
+        self.page_size = page_size
+        self.latency = latency
+        self.recordings = recordings
+        self.requests = 0
+        self._texts = synthetic.corpus_texts()
+        self._videos = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        handler = type("Handler", (_Handler,), {"gdata": self})
+        self.httpd = http.server.ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        """ The url of the videos feed, the base_url of a scraper. """
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}{}".format(host, port, PREFIX.rstrip("/"))
+
+    def video(self, video_id):
+        """
+        Return the feeds of a video, recorded or synthetic.
+
+        :param video_id: the id of the video
+        :return: tuple of the json of the video feed and the list of
+                 comment entries
+        """
+        with self._lock:
+            if video_id not in self._videos:
+                path = os.path.join(self.recordings or "",
+                                    "{}.json".format(video_id))
+                if self.recordings and os.path.exists(path):
+                    with open(path) as read_file:
+                        recording = json.load(read_file)
+                    self._videos[video_id] = (recording["video"],
+                                              recording["comments"])
+                else:
+                    number = self.pages * self.page_size
+                    self._videos[video_id] = (
+                        video_feed(video_id, number),
+                        comment_entries(video_id, number, self._texts))
+            return self._videos[video_id]
+
+    def comments_page(self, video_id, params):
+        """
+        Return a page of the comments feed of a video.
+
+        :param video_id: the id of the video
+        :param params: the query parameters of the request
+        :return: dictionary in the shape of the gdata comments feed
+        """
+        entries = self.video(video_id)[1]
+        start = int(params.get("start-index", 1))
+        size = int(params.get("max-results", self.page_size))
+        feed = {"openSearch$totalResults": {"$t": len(entries)},
+                "link": []}
+        page = entries[start - 1:start - 1 + size]
+        if page:
+            feed["entry"] = page
+        if start - 1 + size < len(entries):
+            query = dict(params, **{"start-index": start + size})
+            feed["link"].append({
+                "rel": "next", "href": "{}/{}/comments?{}".format(
+                    self.base_url, video_id,
+                    urllib.parse.urlencode(query))})
+        return {"feed": feed}
+
+    def start(self):
+        """
+        Start serving in a background thread.
+
+        :return: the base url of the server
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """ Stop serving. """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        """ Start the server in a with statement. """
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        """ Stop the server at the end of a with statement. """
+        self.stop()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    """ Class for handling the requests of a GDataServer. """
+
+    gdata = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Answer a video or comments feed request. """
+        with self.gdata._lock:  # pylint: disable=protected-access
+            self.gdata.requests += 1
+        if self.gdata.latency:
+            time.sleep(self.gdata.latency)
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path[len(PREFIX):].strip("/").split("/")
+        if not url.path.startswith(PREFIX) or not parts[0] or \
+                len(parts) > 2 or parts[1:] not in ([], ["comments"]):
+            self.send_error(404)
+            return
+        if len(parts) == 1:
+            body = self.gdata.video(parts[0])[0]
+        else:
+            body = self.gdata.comments_page(parts[0], params)
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *_):
+        """ Do not log every request. """
+
+
+def main():
+    """ Run the gdata stand-in until interrupted. """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pages", type=int, default=10,
+                        help="comment pages of a synthetic video")
+    parser.add_argument("--page-size", type=int, default=50,
+                        help="comments per page without max-results")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds every response is delayed")
+    parser.add_argument("--recordings", help="directory of recorded videos")
+    args = parser.parse_args()
+
+    server = GDataServer(args.pages, args.page_size, args.latency,
+                         args.recordings, args.host, args.port)
+    print("serving gdata on {}".format(server.base_url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the classifier and database hot paths.
+
+Every case is run on synthetic data of each size, from 100 to 100k
+comments by default. The time of a case is the fastest of --repeat runs,
+its peak memory is traced in one extra run. The results are written as
+JSON, and compared with the results of an earlier commit with --compare:
+a case slower or using more memory than the threshold allows is a
+regression, and makes the run fail.
+
+    python -m benchmark.run --output results.json
+    git checkout other-branch
+    python -m benchmark.run --compare results.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmark import synthetic
+import analysis
+import database
+import models
+import sentiment_analysis
+import tokenizer
+
+SIZES = (100, 1000, 10000, 100000)
+# differences below these are noise, whatever the threshold
+MIN_SECONDS = 0.002
+MIN_BYTES = 256 * 1024
+
+
+class Suite:
+
+    """ Class for the cases of the benchmark suite. """
+
+    def __init__(self, directory):
+        """
+        Set up the classifier and the webservice the cases use.
+
+        :param directory: directory for the model and database files
+        """
+        self.directory = directory
+        self.model_file = os.path.join(directory, "classifier.model")
+        self.analyzer = sentiment_analysis.SentimentAnalysis(self.model_file)
+        import webserve
+        # importing webserve makes every module log at debug level
+        logging.getLogger().setLevel(logging.WARNING)
+        webserve.APP.config["TESTING"] = True
+        self.webserve = webserve
+        self.client = webserve.APP.test_client()
+        self.comments = {}
+
+    def cases(self):
+        """
+        Return the cases of the suite.
+
+        :return: dictionary from case name to a tuple of the function
+                 preparing a run of the case for a size and the largest
+                 size of the case (None = the case has no size)
+        """
+        return {"features": (self.features, None),
+                "classify_comments": (self.classify_comments, None),
+                "train": (self.train, 0),
+                "load_classifier": (self.load_classifier, 0),
+                "save_sentiment": (self.save_sentiment, None),
+                "comment_sentiment_plot": (self.comment_sentiment_plot,
+                                           None),
+                "video_sentiment_plot": (self.video_sentiment_plot, None)}
+
+    def _comments(self, size):
+        """
+        Return size synthetic comments, the same ones for every case.
+
+        :param size: number of comments
+        :return: list of Comment objects
+        """
+        if size not in self.comments:
+            self.comments[size] = synthetic.make_comments(size)
+        return self.comments[size]
+
+    def _database(self):
+        """ Point the database module at a new database file. """
+        database.DB_SESSION.remove()
+        path = os.path.join(self.directory, "project.db")
+        if os.path.exists(path):
+            os.remove(path)
+        synthetic.use_database("sqlite:///{}".format(path))
+        self.webserve.PLOT_CACHE.clear()
+        self.webserve.DENSITY_CACHE.clear()
+
+    def features(self, size):
+        """ The sparse document-word matrix of size comments. """
+        docs = tokenizer.tokenize_many(comment.content
+                                       for comment in self._comments(size))
+        return lambda: self.analyzer.classifier.features(docs)
+
+    def classify_comments(self, size):
+        """ Classifying size comments and making the video sentiment. """
+        comments = self._comments(size)
+        return lambda: self.analyzer.classify_comments(comments)
+
+    def train(self, _size):
+        """ Training the classifier on the corpus and saving it. """
+        analyzer = self.analyzer
+        return lambda: analyzer._train(  # noqa # pylint: disable=protected-access
+            os.path.join(os.path.dirname(sentiment_analysis.__file__),
+                         "data", "corpus.txt"))
+
+    def load_classifier(self, _size):
+        """ Creating a SentimentAnalysis from the saved model file. """
+        return lambda: sentiment_analysis.SentimentAnalysis(self.model_file)
+
+    def save_sentiment(self, size):
+        """ Saving the sentiments of a video with size new comments. """
+        self._database()
+        comments = self._comments(size)
+        database.insert_or_ignore(comments)
+        database.DB_SESSION.commit()
+        sentiments = synthetic.make_comment_sentiments(comments)
+        video_sentiment = models.VideoSentiment(
+            id=comments[0].video_id, n_pos=0.5, n_neg=0.5, result="neutral")
+        return lambda: analysis.save_sentiment(video_sentiment, sentiments)
+
+    def comment_sentiment_plot(self, size):
+        """ Rendering the comment plot of a video with size comments. """
+        self._database()
+        comments = self._comments(size)
+        database.insert_or_ignore(synthetic.make_comment_sentiments(comments))
+        database.DB_SESSION.commit()
+        url = "/comment_sentiment_plot.png?video_id={}".format(
+            comments[0].video_id)
+        return lambda: self._get(url)
+
+    def video_sentiment_plot(self, size):
+        """ Rendering the video plot comparing with size videos. """
+        self._database()
+        sentiments = synthetic.make_video_sentiments(size + 1)
+        database.insert_or_ignore(sentiments)
+        database.DB_SESSION.commit()
+        url = "/video_sentiment_plot.png?video_id={}".format(
+            sentiments[0].id)
+        return lambda: self._get(url)
+
+    def _get(self, url):
+        """
+        Get a page of the webservice, rendering it again.
+
+        :param url: the url of the page
+        """
+        self.webserve.PLOT_CACHE.clear()
+        self.webserve.DENSITY_CACHE.clear()
+        response = self.client.get(url)
+        assert response.status_code == 200, response.status
+        database.DB_SESSION.remove()
+
+
+def measure(prepare, size, repeat):
+    """
+    Time a case and trace its peak memory.
+
+    :param prepare: function preparing a run of the case for a size
+    :param size: the size
+    :param repeat: number of timed runs
+    :return: tuple of the fastest time in seconds and the peak memory in
+             bytes
+    """
+    timings = []
+    for _ in range(repeat):
+        run = prepare(size)
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    run = prepare(size)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def run_suite(cases, sizes, repeat):
+    """
+    Run the cases of the suite.
+
+    :param cases: names of the cases to run, all if empty
+    :param sizes: sizes to run the cases with
+    :param repeat: number of timed runs of a case
+    :return: dictionary of the results, by case name and size
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        suite = Suite(directory)
+        for name, (prepare, max_size) in suite.cases().items():
+            if cases and name not in cases:
+                continue
+            for size in ([0] if max_size == 0 else sizes):
+                if max_size and size > max_size:
+                    continue
+                seconds, peak = measure(prepare, size, repeat)
+                key = "{}/{}".format(name, size) if size else name
+                results[key] = {"case": name, "size": size,
+                                "seconds": seconds, "peak_bytes": peak}
+                print("{:<32} {:10.4f} s {:10.1f} MiB peak".format(
+                    key, seconds, peak / 2 ** 20), flush=True)
+        database.DB_SESSION.remove()
+    return results
+
+
+def metadata():
+    """ Return where and when the benchmark was run. """
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], universal_newlines=True,
+            stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "date": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with the results of an earlier run.
+
+    :param results: dictionary of the results, by case name and size
+    :param baseline: dictionary of the earlier results
+    :param threshold: allowed relative increase of time and memory
+    :return: list of the regressions, as messages
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        for field, unit, noise in (("seconds", "s", MIN_SECONDS),
+                                   ("peak_bytes", "bytes", MIN_BYTES)):
+            limit = old[field] * (1 + threshold)
+            if result[field] > limit and \
+                    result[field] - old[field] > noise:
+                regressions.append("{} {}: {:.4g} {} > {:.4g} {}".format(
+                    key, field, result[field], unit, old[field], unit))
+    return regressions
+
+
+def main():
+    """ Run the benchmark suite, save and compare the results. """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="numbers of comments (or videos)")
+    parser.add_argument("--cases", nargs="+", default=[],
+                        help="names of the cases to run (default all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs of every case")
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--compare", help="results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative increase over --compare")
+    args = parser.parse_args()
+
+    results = run_suite(args.cases, args.sizes, args.repeat)
+    if args.output:
+        with open(args.output, "w") as write_file:
+            json.dump({"meta": metadata(), "results": results}, write_file,
+                      indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as read_file:
+            baseline = json.load(read_file)
+        regressions = compare(results, baseline["results"], args.threshold)
+        print("{} regressions against {} (threshold {:.0%})".format(
+            len(regressions), baseline["meta"].get("commit"),
+            args.threshold))
+        for regression in regressions:
+            print("  " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic data for the benchmarks.
+
+Comments are made from the lines of the training corpus, so they have the
+vocabulary and length of real comments. The database helper points the
+database module at a fresh database, like the tests do.
+"""
+import datetime
+import os
+import random
+
+import sqlalchemy
+
+import database
+import models
+
+CORPUS_PATH = os.path.join(os.path.dirname(database.__file__), "data",
+                           "corpus.txt")
+
+
+def corpus_texts():
+    """
+    Return the texts of the training corpus.
+
+    :return: list of the texts
+    """
+    with open(CORPUS_PATH) as read_file:
+        next(read_file)
+        return [line.split(";", 2)[1].strip() for line in read_file]
+
+
+def make_comments(number, video_id="benchmarkvid", seed=0):
+    """
+    Make synthetic comments for a video.
+
+    The comments are newest first, like the gdata comments feed.
+    :param number: number of comments
+    :param video_id: id of the video of the comments
+    :param seed: seed of the random choice of texts
+    :return: list of Comment objects
+    """
+    rand = random.Random(seed)
+    texts = corpus_texts()
+    start = datetime.datetime(2015, 1, 1)
+    return [models.Comment(id="{}-comment-{}".format(video_id, i),
+                           video_id=video_id,
+                           author_id="author {}".format(i % 97),
+                           author_name="author name {}".format(i % 97),
+                           content=rand.choice(texts),
+                           published=start + datetime.timedelta(
+                               minutes=number - i))
+            for i in range(number)]
+
+
+def make_video(video_id="benchmarkvid", num_of_comments=0):
+    """
+    Make a synthetic video.
+
+    :param video_id: id of the video
+    :param num_of_comments: comment count of the video
+    :return: Video object
+    """
+    now = datetime.datetime.now()
+    return models.Video(id=video_id, title="benchmark video",
+                        author_id="benchmark author", viewcount=1,
+                        duration=60, likes=1, published=now, dislikes=1,
+                        rating=4.5, num_of_raters=2, timestamp=now,
+                        num_of_comments=num_of_comments)
+
+
+def use_database(url="sqlite://"):
+    """
+    Point the database module at a new database with the tables created.
+
+    :param url: sqlalchemy url of the database, in memory by default
+    """
+    database.DB_SESSION.remove()
+    database.ENGINE = sqlalchemy.create_engine(url, echo=False)
+    database.DB_SESSION = sqlalchemy.orm.scoped_session(
+        sqlalchemy.orm.sessionmaker(autocommit=False, autoflush=False,
+                                    bind=database.ENGINE))
+    database.init_db()
+
+
+def make_comment_sentiments(comments, seed=0):
+    """
+    Make synthetic comment sentiments, about half of them positive.
+
+    :param comments: list of Comment objects
+    :param seed: seed of the random sentiments
+    :return: list of CommentSentiment objects
+    """
+    rand = random.Random(seed)
+    return [models.CommentSentiment(id=comment.id, video_id=comment.video_id,
+                                    positive=rand.random() < 0.5)
+            for comment in comments]
+
+
+def make_video_sentiments(number, seed=0):
+    """
+    Make synthetic video sentiments of number videos.
+
+    :param number: number of videos
+    :param seed: seed of the random sentiments
+    :return: list of VideoSentiment objects
+    """
+    rand = random.Random(seed)
+    sentiments = []
+    for i in range(number):
+        n_pos = rand.betavariate(5, 3)
+        sentiments.append(models.VideoSentiment(
+            id="video-{}".format(i), n_pos=n_pos, n_neg=1 - n_pos,
+            result="positive" if n_pos > 0.5 else "negative"))
+    return sentiments
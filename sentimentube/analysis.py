@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for analysing a video.
+
+Scrapes the new comments of a youtube video, stores them in the database,
+classifies the comments without a stored sentiment and stores the sentiment
+of the video. Used by the webservice and by its background jobs.
+"""
+import logging
+import sqlalchemy
+
+import database
+import instrumentation
+import models
+
+LOGGER = logging.getLogger(__name__)
+# called with the video id whenever the sentiment of a video is saved
+SAVE_LISTENERS = []
+
+
+def save_sentiment(video_sentiment, comments_sentiment):
+    """
+    helper function for saving sentiments in the database.
+
+    Saves the results of sentiment analysis to the database.
+    The result of each comment and for the whole video is saved,
+    comment sentiments already in the database are left as they are
+    :param video_sentiment: sentiment result for the whole video:
+    number of pos and neg comments (normalized) and final verdict of the video
+    :param comments_sentiment: comments of the video with their sentiments
+    """
+    with instrumentation.span("save_sentiment"):
+        database.insert_or_ignore(comments_sentiment)
+        database.DB_SESSION.merge(video_sentiment)
+        database.DB_SESSION.commit()
+    for listener in SAVE_LISTENERS:
+        listener(video_sentiment.id)
+
+
+def comment_count(video_id):
+    """
+    helper function for counting the stored comments of a video.
+
+    :param video_id: the id of the video
+    :return: the number of comments
+    """
+    return database.DB_SESSION.query(sqlalchemy.func.count()).select_from(
+        models.Comment).filter(models.Comment.video_id == video_id).scalar()
+
+
+def comment_sentiment_counts(video_id):
+    """
+    helper function for counting the stored comment sentiments of a video.
+
+    :param video_id: the id of the video
+    :return: tuple of the number of positive and negative comments
+    """
+    # counts the rows, not their ids, so only the index is read
+    counts = dict(database.DB_SESSION.query(
+        models.CommentSentiment.positive,
+        sqlalchemy.func.count()).filter(
+            models.CommentSentiment.video_id == video_id).group_by(
+                models.CommentSentiment.positive).all())
+    return counts.get(True, 0), counts.get(False, 0)
+
+
+def category_sentiments(categories):
+    """
+    helper function for querying the sentiments of the videos of categories.
+
+    Only the n_pos and n_neg columns are queried.
+    :param categories: the categories, all videos if empty
+    :return: the query
+    """
+    query = database.DB_SESSION.query(
+        models.VideoSentiment.n_pos, models.VideoSentiment.n_neg)
+    if categories:
+        query = query.filter(models.VideoSentiment.id.in_(
+            sqlalchemy.select(models.VideoCategory.video_id).where(
+                models.VideoCategory.type.in_(categories))))
+    return query
+
+
+def comparison_sentiments(video_id):
+    """
+    helper function for querying the sentiments to compare a video with.
+
+    These are the sentiments of the other videos sharing a category with
+    the video, or of all other videos if it has no stored category.
+    :param video_id: the id of the video
+    :return: tuple of the sorted categories of the video and the query
+    """
+    categories = sorted({category for category, in database.DB_SESSION.query(
+        models.VideoCategory.type).filter(
+            models.VideoCategory.video_id == video_id)})
+    return categories, category_sentiments(categories).filter(
+        models.VideoSentiment.id != video_id)
+
+
+def sentiment_summary(query):
+    """
+    helper function for summarizing the sentiments of a query.
+
+    The summary changes whenever one of the sentiments is added or
+    updated, and gives the extent of the sentiments.
+    :param query: the query of category_sentiments or comparison_sentiments
+    :return: tuple of count, min and max n_pos, min and max n_neg,
+             and the sums of n_pos and n_neg
+    """
+    sentiments = query.subquery()
+    return tuple(database.DB_SESSION.query(
+        sqlalchemy.func.count(),
+        sqlalchemy.func.min(sentiments.c.n_pos),
+        sqlalchemy.func.max(sentiments.c.n_pos),
+        sqlalchemy.func.min(sentiments.c.n_neg),
+        sqlalchemy.func.max(sentiments.c.n_neg),
+        sqlalchemy.func.sum(sentiments.c.n_pos),
+        sqlalchemy.func.sum(sentiments.c.n_neg)).one())
+
+
+def sentiment_density(query, extent, bins):
+    """
+    helper function for counting the sentiments in a grid of bins.
+
+    The sentiments are binned and counted by the database, so only the
+    non-empty bins are loaded.
+    :param query: the query of category_sentiments or comparison_sentiments
+    :param extent: tuple of min and max n_pos, and min and max n_neg
+    :param bins: number of bins along each axis
+    :return: dictionary from (n_pos bin, n_neg bin) to the number of
+             sentiments in the bin
+    """
+    sentiments = query.subquery()
+    min_pos, max_pos, min_neg, max_neg = extent
+
+    def bin_of(column, low, high):
+        """ Return the bin of a column, the maximum is in the last bin. """
+        width = (high - low) / bins or 1
+        # sqlite's min with two arguments is the smaller of the two
+        return sqlalchemy.func.min(sqlalchemy.cast(
+            (column - low) / width, sqlalchemy.Integer), bins - 1)
+
+    pos_bin = bin_of(sentiments.c.n_pos, min_pos, max_pos)
+    neg_bin = bin_of(sentiments.c.n_neg, min_neg, max_neg)
+    return {(row[0], row[1]): row[2] for row in database.DB_SESSION.query(
+        pos_bin, neg_bin, sqlalchemy.func.count()).group_by(
+            pos_bin, neg_bin)}
+
+
+def classify_new_comments(analyzer, video_id):
+    """
+    helper function for classifying the comments without a stored sentiment.
+
+    Stored comments that already have a CommentSentiment are not classified
+    again, the video sentiment is made from the stored positive and negative
+    counts plus the counts of the new comments.
+    :param analyzer: the SentimentAnalysis classifying the comments
+    :param video_id: the id of the video
+    :return: tuple of the VideoSentiment and the new CommentSentiments
+    """
+    with instrumentation.span("load_new_comments"):
+        new_comments = database.DB_SESSION.query(models.Comment).outerjoin(
+            models.CommentSentiment,
+            models.CommentSentiment.id == models.Comment.id).filter(
+                models.Comment.video_id == video_id,
+                models.CommentSentiment.id.is_(None)).all()
+        n_pos, n_neg = comment_sentiment_counts(video_id)
+    LOGGER.info("classifying %d new comments", len(new_comments))
+
+    with instrumentation.span("classify"):
+        comment_sentiments = analyzer.classify_comment_sentiments(
+            new_comments)
+    new_pos = sum(com.positive for com in comment_sentiments)
+    sentiment = analyzer.video_sentiment(
+        video_id, n_pos + new_pos,
+        n_neg + len(comment_sentiments) - new_pos)
+    return sentiment, comment_sentiments
+
+
+def newest_comment(video_id):
+    """
+    helper function for finding the newest stored comment of a video.
+
+    :param video_id: the id of the video
+    :return: the Comment, None if the video has no stored comments
+    """
+    return database.DB_SESSION.query(models.Comment).filter(
+        models.Comment.video_id == video_id).order_by(
+            sqlalchemy.desc(models.Comment.published)).first()
+
+
+def store_comments(video_id, video_info, categories, comments):
+    """
+    helper function for storing a video and its scraped comments.
+
+    The stored info of the video is updated, its categories are only
+    stored with the video the first time.
+    :param video_id: the id of the video
+    :param video_info: the Video fetched from youtube
+    :param categories: the VideoCategories fetched from youtube
+    :param comments: the Comments fetched from youtube
+    """
+    with instrumentation.span("store_comments"):
+        db_video_info = database.DB_SESSION.query(models.Video).filter(
+            models.Video.id == video_id).first()
+        if db_video_info:
+            database.DB_SESSION.merge(video_info)
+        else:
+            database.DB_SESSION.add(video_info)
+            database.DB_SESSION.add_all(categories)
+        database.insert_or_ignore(comments)
+        database.DB_SESSION.commit()
+
+
+def analyse_video(video_id, video_info, categories, scraper, analyzer,
+                  progress=None):
+    """
+    Analyse the new comments of a video and store the results.
+
+    :param video_id: the id of the video
+    :param video_info: the Video fetched from youtube
+    :param categories: the VideoCategories fetched from youtube
+    :param scraper: the YouTubeScraper fetching the comments
+    :param analyzer: the SentimentAnalysis classifying the comments
+    :param progress: called with the keyword pages_fetched after each page
+                     of comments and comments_classified after classifying
+    :return: tuple of the VideoSentiment and the number of stored comments
+    :raises RuntimeError: if the video has no comments
+    """
+    progress = progress or (lambda **_: None)
+    # only fetch the comments newer than the newest stored one
+    with instrumentation.span("fetch_comments"):
+        comments = scraper.fetch_comments(
+            video_id, since=newest_comment(video_id),
+            progress=lambda pages: progress(pages_fetched=pages))
+    store_comments(video_id, video_info, categories, comments)
+
+    sentiment, comment_sentiments = classify_new_comments(analyzer, video_id)
+    progress(comments_classified=len(comment_sentiments))
+
+    save_sentiment(sentiment, comment_sentiments)
+    # only the new comments were fetched, count the stored ones
+    return sentiment, comment_count(video_id)
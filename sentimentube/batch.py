@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for analysing many videos offline.
+
+Reads video ids, one per line, from a file or stdin and analyses each video
+like the webservice does: scrape, classify and persist. The scraping runs in
+its own thread and hands the scraped videos over a bounded queue, so the
+comments of the next videos are fetched while the current one is being
+classified. The throughput of each stage is reported at the end.
+
+    python batch.py video_ids.txt
+    cat video_ids.txt | python batch.py
+"""
+import argparse
+import logging
+import queue
+import sys
+import threading
+import time
+
+import requests
+import sqlalchemy.exc
+
+import analysis
+import database
+import sentiment_analysis
+import youtube
+
+LOGGER = logging.getLogger(__name__)
+# expected errors of a single video, which is skipped, any other error also
+# skips the video but is logged with its traceback
+VIDEO_ERRORS = (ValueError, RuntimeError, requests.exceptions.RequestException,
+                sqlalchemy.exc.SQLAlchemyError)
+
+
+class Stage:
+
+    """ Class for the throughput of a pipeline stage. """
+
+    def __init__(self, name):
+        """
+        Set the empty counts.
+
+        :param name: name of the stage
+        """
+        self.name = name
+        self.videos = 0
+        self.comments = 0
+        self.seconds = 0.0
+
+    def add(self, seconds, comments):
+        """
+        Count a video done by the stage.
+
+        :param seconds: time the stage spent on the video
+        :param comments: number of comments of the video
+        """
+        self.videos += 1
+        self.comments += comments
+        self.seconds += seconds
+
+    def __str__(self):
+        """ Return the throughput of the stage. """
+        seconds = self.seconds or float("nan")
+        return ("{:<9} {:>6} videos {:>9} comments {:9.2f} s "
+                "{:8.2f} videos/s {:10.1f} comments/s").format(
+                    self.name, self.videos, self.comments, self.seconds,
+                    self.videos / seconds, self.comments / seconds)
+
+
+def read_video_ids(lines):
+    """
+    Read the video ids to analyse.
+
+    Blank lines and lines starting with # are skipped, repeated ids are
+    only analysed once. Urls without a video id are logged and skipped.
+    :param lines: iterable of lines, one video id or url per line
+    :return: list of the video ids
+    """
+    video_ids = {}
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            try:
+                video_ids.setdefault(youtube.video_id_from_input(line))
+            except ValueError as err:
+                LOGGER.error("skipping line %r: %s", line, err)
+    return list(video_ids)
+
+
+def _scrape(video_ids, scraper, scraped, stage):
+    """
+    Scrape the videos and put them on a queue, run by the scrape thread.
+
+    Puts a tuple of the video id, info, categories and new comments for each
+    video, or of the video id and the error if scraping failed, and None
+    when all videos are scraped.
+    :param video_ids: list of video ids
+    :param scraper: the YouTubeScraper
+    :param scraped: the queue of scraped videos
+    :param stage: the Stage of the scraping
+    """
+    try:
+        for video_id in video_ids:
+            start = time.perf_counter()
+            try:
+                video_info, categories = scraper.fetch_videoinfo(video_id)
+                # only fetch the comments newer than the newest stored one
+                comments = scraper.fetch_comments(
+                    video_id, since=analysis.newest_comment(video_id))
+            except VIDEO_ERRORS as err:
+                scraped.put((video_id, err))
+                continue
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.exception("scraping video %s failed", video_id)
+                scraped.put((video_id, err))
+                continue
+            finally:
+                database.DB_SESSION.rollback()
+            stage.add(time.perf_counter() - start, len(comments))
+            scraped.put((video_id, video_info, categories, comments))
+    finally:
+        database.DB_SESSION.remove()
+        scraped.put(None)
+
+
+def run_batch(video_ids, scraper, analyzer, queue_size=4):
+    """
+    Analyse videos, scraping the next ones while classifying.
+
+    :param video_ids: list of video ids
+    :param scraper: the YouTubeScraper
+    :param analyzer: the SentimentAnalysis
+    :param queue_size: number of scraped videos waiting to be classified
+    :return: tuple of the Stages (scrape, persist and classify) and the
+             dictionary of failed video ids and their errors, videos that
+             were never analysed are failed as well
+    """
+    stages = Stage("scrape"), Stage("persist"), Stage("classify")
+    scrape_stage, persist_stage, classify_stage = stages
+    failed = {}
+    analysed = set()
+    scraped = queue.Queue(queue_size)
+    thread = threading.Thread(target=_scrape, name="scrape",
+                              args=(video_ids, scraper, scraped,
+                                    scrape_stage), daemon=True)
+    thread.start()
+    for item in iter(scraped.get, None):
+        video_id = item[0]
+        if len(item) == 2:
+            LOGGER.error("scraping video %s failed: %s", video_id, item[1])
+            failed[video_id] = item[1]
+            continue
+        _, video_info, categories, comments = item
+        try:
+            start = time.perf_counter()
+            analysis.store_comments(video_id, video_info, categories,
+                                    comments)
+            persist_stage.add(time.perf_counter() - start, len(comments))
+
+            start = time.perf_counter()
+            sentiment, comment_sentiments = analysis.classify_new_comments(
+                analyzer, video_id)
+            classified = time.perf_counter()
+            analysis.save_sentiment(sentiment, comment_sentiments)
+            classify_stage.add(classified - start, len(comment_sentiments))
+            persist_stage.seconds += time.perf_counter() - classified
+        except VIDEO_ERRORS as err:
+            database.DB_SESSION.rollback()
+            LOGGER.error("analysing video %s failed: %s", video_id, err)
+            failed[video_id] = err
+            continue
+        except Exception as err:  # pylint: disable=broad-except
+            database.DB_SESSION.rollback()
+            LOGGER.exception("analysing video %s failed", video_id)
+            failed[video_id] = err
+            continue
+        analysed.add(video_id)
+        LOGGER.info("video %s: %s (%d new comments)", video_id,
+                    sentiment.result, len(comment_sentiments))
+    thread.join()
+    # the scrape thread ended before scraping them
+    for video_id in video_ids:
+        if video_id not in analysed and video_id not in failed:
+            LOGGER.error("video %s was not analysed", video_id)
+            failed[video_id] = RuntimeError("not analysed")
+    return stages, failed
+
+
+def main():
+    """ Analyse the videos listed in a file or on stdin. """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ids_file", nargs="?", default="-",
+                        help="file with a video id per line (- = stdin)")
+    parser.add_argument("--model", default="data/classifier.model",
+                        help="the classifier model file")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="scraped videos waiting to be classified")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="comment pages fetched at a time")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="processes classifying the comments")
+    parser.add_argument("--gdata-url", default=None,
+                        help="url of the gdata videos feed")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO)
+
+    if args.ids_file == "-":
+        video_ids = read_video_ids(sys.stdin)
+    else:
+        with open(args.ids_file) as read_file:
+            video_ids = read_video_ids(read_file)
+
+    database.init_db()
+    scraper = youtube.YouTubeScraper(concurrency=args.concurrency,
+                                     base_url=args.gdata_url)
+    analyzer = sentiment_analysis.SentimentAnalysis(
+        args.model, processes=args.processes)
+    start = time.perf_counter()
+    try:
+        stages, failed = run_batch(video_ids, scraper, analyzer,
+                                   args.queue_size)
+    finally:
+        analyzer.close()
+    seconds = time.perf_counter() - start
+
+    for stage in stages:
+        print(stage)
+    print("{} videos in {:.2f} s ({:.2f} videos/s), {} failed".format(
+        len(video_ids), seconds, len(video_ids) / (seconds or float("nan")),
+        len(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
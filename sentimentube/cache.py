@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for caching rendered responses in memory.
+
+The webservice keeps the PNG plots it renders in an LRUCache, keyed by the
+data the plot is drawn from, so a plot is only rendered again when its data
+changes or it has been evicted.
+"""
+import collections
+import threading
+
+
+class LRUCache:
+
+    """ Class for a least recently used cache bounded by size. """
+
+    def __init__(self, max_size, max_entries=0):
+        """
+        Set the bounds of the cache.
+
+        :param max_size: total size of the values kept, in bytes
+        :param max_entries: number of values kept (0 = no limit)
+        """
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """ Return the number of values in the cache. """
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """ Return whether a key is in the cache, without using it. """
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Return the value of a key and mark it as recently used.
+
+        :param key: the key of the value
+        :param default: returned if the key is not in the cache
+        :return: the value of the key
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, size=None):
+        """
+        Add a value, evicting the least recently used ones to make room.
+
+        A value larger than the whole cache is not added.
+        :param key: the key of the value
+        :param value: the value
+        :param size: size of the value in bytes, len(value) if not given
+        """
+        size = len(value) if size is None else size
+        with self._lock:
+            self._remove(key)
+            if size > self.max_size:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size or \
+                    0 < self.max_entries < len(self._entries):
+                self._remove(next(iter(self._entries)))
+
+    def remove(self, key):
+        """
+        Remove a key from the cache, if it is there.
+
+        :param key: the key of the value
+        """
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """ Remove every value from the cache. """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        """
+        Remove a key, the lock must be held.
+
+        :param key: the key of the value
+        """
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[1]
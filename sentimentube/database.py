@@ -4,6 +4,7 @@
 import sqlalchemy
 from sqlalchemy.ext.declarative import declarative_base
 import os
+import sqlite3
 
 
 CWDIR = os.path.join(os.path.dirname(__file__), "data", "project.db")
@@ -13,9 +14,66 @@ DB_SESSION = sqlalchemy.orm.scoped_session(sqlalchemy.orm.sessionmaker(
     autoflush=False,
     bind=ENGINE))
 BASE = declarative_base()
+# applied to every new SQLite connection
+PRAGMAS = (
+    # readers are not blocked by the writing background jobs
+    "journal_mode=WAL",
+    # with WAL, only a power loss can lose the last commits
+    "synchronous=NORMAL",
+    # 20 MB page cache per connection (negative sizes are in KiB)
+    "cache_size=-20000")
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, "connect")
+def set_pragmas(dbapi_connection, _connection_record):
+    """
+    Tune a new SQLite connection.
+
+    :param dbapi_connection: the new DB-API connection
+    :param _connection_record: the pool record of the connection
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS:
+            cursor.execute("PRAGMA {}".format(pragma))
+        cursor.close()
 
 
 def init_db():
-    """ Create the database and its tables. """
+    """ Create the database and its tables, and migrate an existing one. """
     import models  # noqa # pylint: disable=unused-variable
     BASE.metadata.create_all(bind=ENGINE)
+    migrate_db()
+
+
+def migrate_db():
+    """
+    Bring the schema of an existing database up to date.
+
+    create_all does not touch tables that already exist, so indexes added
+    to the models since the database was created are created here.
+    """
+    import models  # noqa # pylint: disable=unused-variable
+    for table in BASE.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=ENGINE, checkfirst=True)
+
+
+def insert_or_ignore(objects, batch_size=500):
+    """
+    Insert model objects, ignoring the ones already in the database.
+
+    The objects are inserted with SQLite's INSERT OR IGNORE in batches of
+    executemany, instead of checking and adding them one by one. They are
+    not added to the session.
+    :param objects: list of objects of the same model
+    :param batch_size: number of rows per executemany
+    """
+    if not objects:
+        return
+    table = objects[0].__table__
+    statement = table.insert().prefix_with("OR IGNORE")
+    rows = [{column.name: getattr(obj, column.name)
+             for column in table.columns} for obj in objects]
+    for start in range(0, len(rows), batch_size):
+        DB_SESSION.execute(statement, rows[start:start + batch_size])
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for timing the stages of a request.
+
+The stages of the hot path are wrapped in spans:
+
+    with instrumentation.span("classify"):
+        ...
+
+A span only measures anything while a request is being recorded in the
+thread, between start_request and finish_request, otherwise it is a shared
+no-op. The webservice records the requests when its INSTRUMENTATION
+setting is on, sends the time of each stage in the Server-Timing header
+and serves histograms of the times in the Prometheus text format.
+"""
+import bisect
+import threading
+import time
+
+# upper bounds of the histogram buckets in seconds, the Prometheus defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_LOCAL = threading.local()
+
+
+class Histogram:
+
+    """ Class for a histogram of durations. """
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        Set the empty buckets.
+
+        :param buckets: sorted upper bounds of the buckets in seconds
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        Count a duration.
+
+        :param seconds: the duration in seconds
+        """
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def cumulative(self):
+        """
+        Return the cumulative counts of the buckets.
+
+        :return: list of tuples of the upper bound (+Inf last) and the
+                 number of durations up to it
+        """
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+class Registry:
+
+    """ Class for the histograms of the metrics, by label value. """
+
+    def __init__(self):
+        """ Set the metrics and their empty histograms. """
+        self.metrics = {
+            "sentimentube_request_seconds": (
+                "endpoint", "Time spent handling a request.", {}),
+            "sentimentube_span_seconds": (
+                "span", "Time spent in an instrumented stage.", {})}
+        self._lock = threading.Lock()
+
+    def observe(self, metric, label, seconds):
+        """
+        Count a duration in the histogram of a metric and label value.
+
+        :param metric: the name of the metric
+        :param label: the label value
+        :param seconds: the duration in seconds
+        """
+        histograms = self.metrics[metric][2]
+        histogram = histograms.get(label)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(label, Histogram())
+        histogram.observe(seconds)
+
+    def clear(self):
+        """ Remove every histogram. """
+        with self._lock:
+            for _, _, histograms in self.metrics.values():
+                histograms.clear()
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text format.
+
+        :return: the metrics as a string
+        """
+        lines = []
+        for metric, (label, text, histograms) in self.metrics.items():
+            lines.append("# HELP {} {}".format(metric, text))
+            lines.append("# TYPE {} histogram".format(metric))
+            for value, histogram in sorted(histograms.items()):
+                value = value.replace("\\", "\\\\").replace('"', '\\"')
+                for bound, count in histogram.cumulative():
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(
+                        metric, label, value,
+                        "+Inf" if bound == float("inf") else bound, count))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(
+                    metric, label, value, histogram.sum))
+                lines.append('{}_count{{{}="{}"}} {}'.format(
+                    metric, label, value, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Span:
+
+    """ Class for a span timing a stage of a recorded request. """
+
+    def __init__(self, name, spans):
+        """
+        Set the name of the stage.
+
+        :param name: the name of the stage
+        :param spans: the spans of the request, the span is added to it
+        """
+        self.name = name
+        self.spans = spans
+        self.start = None
+
+    def __enter__(self):
+        """ Start timing. """
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        """ Stop timing and add the span to the request. """
+        self.spans.append((self.name, time.perf_counter() - self.start))
+
+
+class _NullSpan:
+
+    """ Class for the span used when the request is not recorded. """
+
+    def __enter__(self):
+        """ Do nothing. """
+        return self
+
+    def __exit__(self, *_):
+        """ Do nothing. """
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """
+    Return a context manager timing a stage of the recorded request.
+
+    :param name: the name of the stage
+    :return: the span, a no-op if no request is recorded in the thread
+    """
+    spans = getattr(_LOCAL, "spans", None)
+    if spans is None:
+        return _NULL_SPAN
+    return _Span(name, spans)
+
+
+def start_request():
+    """ Start recording the spans of a request in this thread. """
+    _LOCAL.spans = []
+    _LOCAL.start = time.perf_counter()
+
+
+def finish_request(endpoint, registry=REGISTRY):
+    """
+    Stop recording the request of this thread and count its durations.
+
+    :param endpoint: the name of the endpoint of the request
+    :param registry: the Registry counting the durations
+    :return: tuple of the seconds of the request and the list of its
+             spans, as tuples of name and seconds, None if no request was
+             recorded
+    """
+    spans = getattr(_LOCAL, "spans", None)
+    if spans is None:
+        return None
+    seconds = time.perf_counter() - _LOCAL.start
+    _LOCAL.spans = None
+    registry.observe("sentimentube_request_seconds", endpoint, seconds)
+    for name, span_seconds in spans:
+        registry.observe("sentimentube_span_seconds", name, span_seconds)
+    return seconds, spans
+
+
+def server_timing(seconds, spans):
+    """
+    Format the durations of a request as a Server-Timing header.
+
+    The spans with the same name are added up.
+    :param seconds: the seconds of the request
+    :param spans: list of tuples of span name and seconds
+    :return: the value of the header
+    """
+    totals = {}
+    for name, span_seconds in spans:
+        totals[name] = totals.get(name, 0) + span_seconds
+    return ", ".join("{};dur={:.1f}".format(name, span_seconds * 1000)
+                     for name, span_seconds in
+                     list(totals.items()) + [("total", seconds)])
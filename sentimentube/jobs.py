@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for analysing videos in background jobs.
+
+The webservice submits the analysis of a video to a JobManager instead of
+analysing it inside the request. The jobs run in a pool of worker
+processes, each with its own scraper, classifier and database connection,
+and report their progress to a status dictionary shared with the
+webservice. A video has at most one queued or running job, submitting it
+again returns the status of that job. The statuses of finished jobs are
+kept in a bounded cache, so the page of a video can still see that its job
+is done.
+"""
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import threading
+
+import analysis
+import cache
+import database
+import models
+import sentiment_analysis
+import youtube
+
+LOGGER = logging.getLogger(__name__)
+# the scraper and analyzer of a worker process, set by _init_worker
+_WORKER = {}
+
+
+def _init_worker(model_file):
+    """
+    Set up a worker process.
+
+    The database connections inherited from the parent process are
+    discarded, so the worker opens its own.
+    :param model_file: path of the classifier model file
+    """
+    database.ENGINE.dispose()
+    _WORKER["scraper"] = youtube.YouTubeScraper()
+    _WORKER["analyzer"] = sentiment_analysis.SentimentAnalysis(model_file)
+
+
+def _update(statuses, video_id, **changes):
+    """
+    Update the status of a job.
+
+    The shared dictionary only notices assignments, so the status is
+    replaced instead of changed.
+    :param statuses: the shared status dictionary
+    :param video_id: the id of the video of the job
+    :param changes: the status keys to change
+    """
+    status = dict(statuses[video_id])
+    status.update(changes)
+    statuses[video_id] = status
+
+
+def run_job(video_id, statuses, info=None):
+    """
+    Analyse a video in a worker process.
+
+    The video is stored with the info the webservice fetched, if given, so
+    the stored number of comments is the one the webservice compares with.
+    :param video_id: the id of the video
+    :param statuses: the shared status dictionary
+    :param info: tuple of the column values of the Video and the types of
+                 its categories, fetched again if None
+    """
+    _update(statuses, video_id, state="running")
+    try:
+        if info is None:
+            video_info, categories = _WORKER["scraper"].fetch_videoinfo(
+                video_id)
+        else:
+            columns, types = info
+            video_info = models.Video(**columns)
+            categories = [models.VideoCategory(video_id=video_id,
+                                               type=category)
+                          for category in types]
+        analysis.analyse_video(
+            video_id, video_info, categories, _WORKER["scraper"],
+            _WORKER["analyzer"],
+            progress=lambda **changes: _update(statuses, video_id,
+                                               **changes))
+    except (ValueError, RuntimeError) as err:
+        database.DB_SESSION.rollback()
+        LOGGER.error("job for video %s failed: %s", video_id, err)
+        _update(statuses, video_id, state="failed", error=str(err))
+    except Exception as err:  # pylint: disable=broad-except
+        database.DB_SESSION.rollback()
+        LOGGER.exception("job for video %s failed", video_id)
+        _update(statuses, video_id, state="failed", error=repr(err))
+    else:
+        _update(statuses, video_id, state="done")
+    finally:
+        database.DB_SESSION.remove()
+
+
+class JobManager:
+
+    """ Class for queueing video analyses in worker processes. """
+
+    def __init__(self, processes=2, model_file="data/classifier.model",
+                 target=run_job, finished=1024):
+        """
+        Set the number of worker processes.
+
+        The processes are started when the first job is submitted.
+        :param processes: number of worker processes
+        :param model_file: path of the classifier model file
+        :param target: the function running a job in a worker
+        :param finished: number of finished jobs whose status is kept
+        """
+        self.processes = processes
+        self.model_file = model_file
+        self.target = target
+        # a job finished before its callback is added calls it right away,
+        # in the submitting thread holding the lock
+        self._lock = threading.RLock()
+        self._futures = {}
+        self._finished = cache.LRUCache(max_size=finished)
+        self._manager = None
+        self._statuses = None
+        self._executor = None
+
+    def _start(self):
+        """ Start the status manager and the worker processes. """
+        if self._executor is None:
+            self._manager = multiprocessing.Manager()
+            self._statuses = self._manager.dict()
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                self.processes, initializer=_init_worker,
+                initargs=(self.model_file,))
+
+    def submit(self, video_id, info=None):
+        """
+        Queue the analysis of a video, unless it is already queued.
+
+        :param video_id: the id of the video
+        :param info: tuple of the column values of the Video and the types
+                     of its categories, fetched by the job if None
+        :return: the status of the job of the video
+        """
+        with self._lock:
+            self._start()
+            future = self._futures.get(video_id)
+            if future is None or future.done():
+                LOGGER.info("queueing job for video %s", video_id)
+                self._statuses[video_id] = {
+                    "video_id": video_id, "state": "queued",
+                    "pages_fetched": 0, "comments_classified": 0,
+                    "error": None}
+                future = self._executor.submit(
+                    self.target, video_id, self._statuses, info)
+                self._futures[video_id] = future
+                future.add_done_callback(
+                    functools.partial(self._finish, video_id))
+            return self.status(video_id)
+
+    def _finish(self, video_id, future):
+        """
+        Move the status of a finished job to the finished jobs.
+
+        A job that died without reporting it, such as when its worker
+        process was killed, is marked as failed.
+        :param video_id: the id of the video of the job
+        :param future: the future of the job
+        """
+        with self._lock:
+            if self._futures.get(video_id) is not future or \
+                    self._statuses is None:
+                return
+            status = dict(self._statuses[video_id])
+            if status["state"] not in ("done", "failed"):
+                error = "cancelled" if future.cancelled() else \
+                    repr(future.exception())
+                LOGGER.error("job for video %s died: %s", video_id, error)
+                status.update(state="failed", error=error)
+            self._finished.put(video_id, status, size=1)
+            del self._futures[video_id]
+            del self._statuses[video_id]
+
+    def status(self, video_id):
+        """
+        Return the status of the last job of a video.
+
+        :param video_id: the id of the video
+        :return: dictionary with the keys video_id, state (queued, running,
+                 done or failed), pages_fetched, comments_classified and
+                 error, None if the video has no job
+        """
+        with self._lock:
+            if self._statuses is not None and video_id in self._statuses:
+                return dict(self._statuses[video_id])
+            status = self._finished.get(video_id)
+            return None if status is None else dict(status)
+
+    def shutdown(self):
+        """ Wait for the jobs and stop the worker processes. """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._manager.shutdown()
+            self._executor = None
+            self._statuses = None
+            self._futures = {}
@@ -13,7 +13,10 @@ class Comment(BASE):
     """ Comment object. """
 
     __tablename__ = "comments"
-    __table_args__ = {'extend_existing': True}
+    # the comments of a video, newest first
+    __table_args__ = (sqlalchemy.Index("ix_comments_video_id_published",
+                                       "video_id", "published"),
+                      {'extend_existing': True})
     id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
     video_id = sqlalchemy.Column(sqlalchemy.String,
                                  sqlalchemy.ForeignKey("videos.id"))
@@ -45,7 +48,8 @@ class Video(BASE):
     dislikes = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
     rating = sqlalchemy.Column(sqlalchemy.Float, nullable=True)
     num_of_raters = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
-    timestamp = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False)
+    timestamp = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False,
+                                  index=True)
     num_of_comments = sqlalchemy.Column(sqlalchemy.Integer,
                                         nullable=False)
 
@@ -80,7 +84,11 @@ class CommentSentiment(BASE):
     """ CommentSentiment object. """
 
     __tablename__ = "commentsentiments"
-    __table_args__ = {'extend_existing': True}
+    # counting the positive and negative comments of a video only reads
+    # the index
+    __table_args__ = (sqlalchemy.Index(
+        "ix_commentsentiments_video_id_positive", "video_id", "positive"),
+                      {'extend_existing': True})
     id = sqlalchemy.Column(sqlalchemy.String,
                            sqlalchemy.ForeignKey("comments.id"),
                            primary_key=True, nullable=False)
@@ -105,8 +113,8 @@ class VideoCategory(BASE):
                            primary_key=True, nullable=False)
     video_id = sqlalchemy.Column(sqlalchemy.String,
                                  sqlalchemy.ForeignKey("videos.id"),
-                                 nullable=False)
-    type = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+                                 nullable=False, index=True)
+    type = sqlalchemy.Column(sqlalchemy.String, nullable=False, index=True)
 
     def __repr__(self):
         """ __repr__ method for VideoCategory. """
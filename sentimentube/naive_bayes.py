@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for vectorized Naïve Bayes classification.
+
+A trained nltk NaiveBayesClassifier is compiled into NumPy arrays:
+the log prior of every label and the log likelihood of every corpus word
+being present or absent given the label. A batch of documents is then
+scored with a single sparse matrix product instead of one classifier call
+per document.
+
+NaiveBayesCounts trains the same model from word/label document counts,
+without building a featureset for every document.
+
+A compiled model is saved in a versioned binary file which is memory mapped
+read-only when loaded, so processes loading the same file share it:
+
+    header      magic, format version, number of labels and words, and the
+                byte sizes of the label and word tables (little-endian)
+    labels      the labels, utf-8 and newline separated
+    vocabulary  the words, utf-8 and newline separated
+    log priors  float32 array (labels)
+    likelihoods float32 array (words x 2 * labels), the present log
+                likelihoods of each label followed by the absent ones
+
+Run as a script to train a model file from the corpus. Pickled nltk
+classifiers are not converted, their vocabulary was made by the tokenization
+before version 2.
+"""
+
+import argparse
+import collections
+import mmap
+import os
+import struct
+import nltk
+import numpy
+import scipy.sparse
+
+# the expected likelihood estimate nltk uses by default when training
+GAMMA = 0.5
+MAGIC = b"SNBM"
+# version 2: the vocabulary is made by tokenizer.tokenize, older model files
+# are trained again
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sIIIII")
+DTYPE = numpy.dtype("<f4")
+
+
+def feature_name(word):
+    """
+    Return the feature name used for a word by the classifier.
+
+    :param word: The word
+    :return: The feature name, "contains(word)"
+    """
+    return "contains({})".format(word)
+
+
+class NaiveBayesScorer:
+
+    """ Class for scoring documents with a compiled Naïve Bayes model. """
+
+    def __init__(self, labels, vocabulary, log_priors, likelihoods):
+        """
+        Set the compiled model arrays.
+
+        :param labels: List of the labels
+        :param vocabulary: List of the corpus words
+        :param log_priors: Array (labels) with the log prior of each label
+        :param likelihoods: Array (words x 2 * labels) with the log
+                            likelihood of each word being in a document of
+                            each label, followed by the log likelihood of it
+                            not being in a document of each label
+        """
+        self.labels = list(labels)
+        self.vocabulary = list(vocabulary)
+        self.index = {word: i for i, word in enumerate(self.vocabulary)}
+        self.log_priors = log_priors
+        self.likelihoods = likelihoods
+        # a document starts out with every word absent, each word present
+        # in the document then swaps its absent term for its present term
+        self._base = log_priors + self.absent.sum(axis=0, dtype=float)
+
+    @property
+    def present(self):
+        """ Array (words x labels) of present log likelihoods. """
+        return self.likelihoods[:, :len(self.labels)]
+
+    @property
+    def absent(self):
+        """ Array (words x labels) of absent log likelihoods. """
+        return self.likelihoods[:, len(self.labels):]
+
+    @classmethod
+    def from_classifier(cls, classifier, word_list=None):
+        """
+        Compile a trained nltk NaiveBayesClassifier.
+
+        :param classifier: The trained classifier
+        :param word_list: The words the classifier was trained on, taken
+                          from its feature names if not given
+        :return: A NaiveBayesScorer giving the same labels as the classifier
+        """
+        # pylint: disable=protected-access
+        if word_list is None:
+            word_list = {fname[len("contains("):-1]
+                         for _, fname in classifier._feature_probdist}
+        labels = list(classifier.labels())
+        vocabulary = sorted(word_list)
+        log_priors = numpy.array([classifier._label_probdist.logprob(label)
+                                  for label in labels])
+        present = numpy.empty((len(vocabulary), len(labels)))
+        absent = numpy.empty((len(vocabulary), len(labels)))
+        for col, label in enumerate(labels):
+            for row, word in enumerate(vocabulary):
+                probdist = classifier._feature_probdist[
+                    label, feature_name(word)]
+                present[row, col] = probdist.logprob(True)
+                absent[row, col] = probdist.logprob(False)
+        return cls(labels, vocabulary, log_priors,
+                   numpy.hstack([present, absent]))
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Load a model file, memory mapping its arrays read-only.
+
+        :param file_path: Path of the model file
+        :return: The loaded NaiveBayesScorer
+        :raises ValueError: if the file is not a model file of this version
+        """
+        with open(file_path, "rb") as read_file:
+            data = mmap.mmap(read_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(data) < HEADER.size:
+            raise ValueError("{} is not a model file".format(file_path))
+        magic, version, num_labels, num_words, labels_size, words_size = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("{} is not a model file".format(file_path))
+        if version != FORMAT_VERSION:
+            raise ValueError("{} has model format version {}, expected {}"
+                             .format(file_path, version, FORMAT_VERSION))
+        offset = HEADER.size
+        labels = data[offset:offset + labels_size].decode("utf-8")
+        offset += labels_size
+        vocabulary = data[offset:offset + words_size].decode("utf-8")
+        offset += words_size
+        offset += -offset % DTYPE.itemsize
+        log_priors = numpy.frombuffer(data, DTYPE, num_labels, offset)
+        offset += log_priors.nbytes
+        likelihoods = numpy.frombuffer(
+            data, DTYPE, num_words * 2 * num_labels, offset).reshape(
+                (num_words, 2 * num_labels))
+        return cls(labels.split("\n"),
+                   vocabulary.split("\n") if num_words else [],
+                   log_priors, likelihoods)
+
+    def save(self, file_path):
+        """
+        Save the model to a model file.
+
+        The model is written to a new file which then replaces the model
+        file, so processes that have the old file memory mapped keep it.
+        Rewriting the mapped file in place would crash them with SIGBUS.
+        :param file_path: Path of the model file
+        """
+        labels = "\n".join(self.labels).encode("utf-8")
+        vocabulary = "\n".join(self.vocabulary).encode("utf-8")
+        # named by the process, processes training at the same time don't
+        # write to the same file
+        temp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        try:
+            with open(temp_path, "wb") as write_file:
+                write_file.write(HEADER.pack(MAGIC, FORMAT_VERSION,
+                                             len(self.labels),
+                                             len(self.vocabulary),
+                                             len(labels), len(vocabulary)))
+                write_file.write(labels)
+                write_file.write(vocabulary)
+                size = HEADER.size + len(labels) + len(vocabulary)
+                write_file.write(b"\0" * (-size % DTYPE.itemsize))
+                write_file.write(numpy.asarray(self.log_priors,
+                                               DTYPE).tobytes())
+                write_file.write(numpy.asarray(self.likelihoods,
+                                               DTYPE).tobytes())
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def features(self, docs):
+        """
+        Build the sparse document-word matrix for a batch of documents.
+
+        :param docs: List of documents, each a list of words
+        :return: CSR matrix (documents x words) with 1 where the word is in
+                 the document
+        """
+        indptr = [0]
+        indices = []
+        for doc in docs:
+            indices.extend({self.index[word] for word in doc
+                            if word in self.index})
+            indptr.append(len(indices))
+        data = numpy.ones(len(indices))
+        return scipy.sparse.csr_matrix((data, indices, indptr),
+                                       shape=(len(docs),
+                                              len(self.vocabulary)))
+
+    def scores(self, docs):
+        """
+        Compute the log probability of each label for a batch of documents.
+
+        :param docs: List of documents, each a list of words
+        :return: Array (documents x labels) of unnormalized log probabilities
+        """
+        likelihoods = self.features(docs).dot(self.likelihoods)
+        num_labels = len(self.labels)
+        return (self._base + likelihoods[:, :num_labels] -
+                likelihoods[:, num_labels:])
+
+    def classify_many(self, docs):
+        """
+        Classify a batch of documents.
+
+        :param docs: List of documents, each a list of words
+        :return: List with the most probable label of each document
+        """
+        if not docs:
+            return []
+        return [self.labels[i] for i in self.scores(docs).argmax(axis=1)]
+
+
+class NaiveBayesCounts:
+
+    """ Class for counting words and labels of a training corpus. """
+
+    def __init__(self):
+        """ Set the empty label and word counts. """
+        self.label_counts = collections.Counter()
+        self.word_counts = collections.defaultdict(collections.Counter)
+
+    def add(self, words, label):
+        """
+        Count a single training document.
+
+        :param words: List of words of the document
+        :param label: The label of the document
+        """
+        self.label_counts[label] += 1
+        for word in set(words):
+            self.word_counts[word][label] += 1
+
+    def _bins(self, label_counts):
+        """
+        Return the number of values a word feature was seen with.
+
+        A word is always seen as present, and as absent unless it is in
+        every document.
+
+        :param label_counts: Counter with the documents per label that
+                             contain the word
+        """
+        return 1 if sum(label_counts.values()) == \
+            sum(self.label_counts.values()) else 2
+
+    def to_classifier(self):
+        """
+        Create the nltk NaiveBayesClassifier for the counts.
+
+        :return: The same classifier nltk trains on the full featuresets
+        """
+        label_probdist = nltk.ELEProbDist(nltk.FreqDist(self.label_counts))
+        feature_probdist = {}
+        for word, label_counts in self.word_counts.items():
+            bins = self._bins(label_counts)
+            for label, num_samples in self.label_counts.items():
+                freqdist = nltk.FreqDist()
+                if label_counts[label]:
+                    freqdist[True] = label_counts[label]
+                if num_samples - label_counts[label]:
+                    freqdist[False] = num_samples - label_counts[label]
+                feature_probdist[label, feature_name(word)] = \
+                    nltk.ELEProbDist(freqdist, bins=bins)
+        return nltk.NaiveBayesClassifier(label_probdist, feature_probdist)
+
+    def to_scorer(self):
+        """
+        Create the NaiveBayesScorer for the counts.
+
+        :return: A NaiveBayesScorer equal to compiling to_classifier()
+        """
+        labels = list(self.label_counts)
+        vocabulary = sorted(self.word_counts)
+        num_samples = numpy.array([self.label_counts[label]
+                                   for label in labels], dtype=float)
+        counts = numpy.array([[self.word_counts[word][label]
+                               for label in labels]
+                              for word in vocabulary], dtype=float)
+        counts = counts.reshape((len(vocabulary), len(labels)))
+        bins = numpy.array([self._bins(self.word_counts[word])
+                            for word in vocabulary], dtype=float)
+        divisor = num_samples + GAMMA * bins[:, numpy.newaxis]
+        log_priors = numpy.log2((num_samples + GAMMA) /
+                                (num_samples.sum() + GAMMA * len(labels)))
+        present = numpy.log2((counts + GAMMA) / divisor)
+        absent = numpy.log2((num_samples - counts + GAMMA) / divisor)
+        return NaiveBayesScorer(labels, vocabulary, log_priors,
+                                numpy.hstack([present, absent]))
+
+
+def main():
+    """
+    Train a model file from the corpus.
+
+    A pickled nltk classifier is not converted: its vocabulary was made by
+    the tokenization before FORMAT_VERSION 2, so it doesn't match the words
+    of the comments it would classify. A model file that loads is kept.
+    """
+    # sentiment_analysis imports this module
+    import sentiment_analysis
+    parser = argparse.ArgumentParser(description="Train a model file from "
+                                                 "the corpus.")
+    parser.add_argument("model_file", help="the model file to write")
+    parser.add_argument("--corpus", default="data/corpus.txt",
+                        help="the corpus to train on")
+    args = parser.parse_args()
+    sentiment_analysis.SentimentAnalysis(
+        os.path.abspath(args.model_file),
+        os.path.abspath(args.corpus)).close()
+
+
+if __name__ == "__main__":
+    main()
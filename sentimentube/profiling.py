@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for profiling single requests.
+
+A request is profiled when it asks for it, with the secret profiling token
+in the X-Profile header or the profile query parameter, or when it is
+sampled, one in every N requests. Without a token only sampled requests
+are profiled, so anonymous clients can't have every request profiled.
+The profile of the handler is written as a pstats file to a directory that
+keeps only the newest files, so it can be left on in production:
+
+    python -m pstats 20150101T120000-000042-video.pstats
+"""
+import cProfile
+import datetime
+import hmac
+import itertools
+import os
+import threading
+
+HEADER = "X-Profile"
+PARAMETER = "profile"
+# one profiler can run at a time, requests arriving meanwhile are not
+# profiled
+_PROFILING = threading.Lock()
+_REQUESTS = itertools.count(1)
+_PROFILES = itertools.count(1)
+
+
+def wanted(request, sample_every=0, token=None):
+    """
+    Check if a request should be profiled.
+
+    :param request: the flask request
+    :param sample_every: profile one in this many requests (0 = only the
+                         requests asking for it)
+    :param token: the secret a request asking to be profiled must send
+                  (None = requests can't ask for it)
+    :return: True if the request should be profiled
+    """
+    if token:
+        for value in (request.headers.get(HEADER, ""),
+                      request.args.get(PARAMETER, "")):
+            if hmac.compare_digest(value.encode("utf-8"),
+                                   token.encode("utf-8")):
+                return True
+    return sample_every > 0 and next(_REQUESTS) % sample_every == 0
+
+
+def run(func, directory, name, keep=50):
+    """
+    Run a function under cProfile and save the profile.
+
+    If another profile is being taken, the function is run without one.
+    :param func: the function, called without arguments
+    :param directory: the directory of the profiles
+    :param name: name of the profile, such as the endpoint
+    :param keep: number of the newest profiles kept in the directory
+    :return: tuple of the result of the function and the path of the
+             profile, None if it was not profiled
+    """
+    if not _PROFILING.acquire(blocking=False):
+        return func(), None
+    try:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func)
+    finally:
+        _PROFILING.release()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "{:%Y%m%dT%H%M%S}-{:06d}-{}.pstats".format(
+        datetime.datetime.now(), next(_PROFILES), name))
+    profiler.dump_stats(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    prune(directory, keep)
+    return result, path
+
+
+def prune(directory, keep):
+    """
+    Remove all but the newest profiles of a directory.
+
+    :param directory: the directory of the profiles
+    :param keep: number of profiles kept
+    """
+    profiles = sorted((entry.stat().st_mtime, entry.name)
+                      for entry in os.scandir(directory)
+                      if entry.name.endswith(".pstats"))
+    for _, file_name in profiles[:max(len(profiles) - keep, 0)]:
+        try:
+            os.remove(os.path.join(directory, file_name))
+        except FileNotFoundError:
+            pass
@@ -5,114 +5,136 @@
 Module for sentiment analysis.
 
 This module has 3 purposes:
-1: Can load an existing classifier from a pickle file
-2: Train and save a classifier to a pickle file
+1: Can load an existing classifier from a model file
+2: Train and save a classifier to a model file
 3: Can classify multiple comments objects (from a list) and deduct an overall
    classification of the video
 The comments object, is the comments from the youtube video which want to be
 classified.
+Large comment lists can be classified in a pool of worker processes, which
+are given the arrays of the classifier already loaded in this process.
 """
 
-import nltk.classify.util
-import pickle
 import os
 import logging
+import multiprocessing
+import time
+import tracemalloc
 import models
-from nltk.corpus import stopwords
-CUSTOM_STOP_WORDS = ['band', 'they', 'them']
+import naive_bayes
+import tokenizer
+# older classifiers were trained with the short label names
+POSITIVE_LABELS = ("pos", "positive")
+# the classifier of a worker process, set by _init_worker
+_WORKER_CLASSIFIER = None
 
 
-def create_word_list(text_words_tuples):
+def _init_worker(labels, vocabulary, log_priors, likelihoods):
     """
-    Create a big set with ALL of the words from the corpus.
+    Set up the classifier of a worker process.
+
+    The worker is given the arrays of the loaded classifier instead of
+    loading the model file, which could fail in every worker and have the
+    pool start new ones forever.
+    :param labels: List of the labels
+    :param vocabulary: List of the corpus words
+    :param log_priors: Array with the log prior of each label
+    :param likelihoods: Array with the log likelihoods of each word
+    """
+    global _WORKER_CLASSIFIER  # pylint: disable=global-statement
+    _WORKER_CLASSIFIER = naive_bayes.NaiveBayesScorer(
+        labels, vocabulary, log_priors, likelihoods)
+
+
+def _classify_contents(contents, classifier=None):
+    """
+    Classify the contents of a chunk of comments.
 
-    :param text_words_tuples: Tuple with all text and their sentiments
-    :return words_list: The big set with all the words
+    :param contents: List of comment contents
+    :param classifier: The classifier, the worker classifier if None
+    :return: List with the label of each content
     """
-    words_list = set()
-    for (words, _) in text_words_tuples:
-        for word in words:
-            words_list.add(word.lower())
-    return words_list
+    if classifier is None:
+        classifier = _WORKER_CLASSIFIER
+    return classifier.classify_many(tokenizer.tokenize_many(contents))
 
 
 def create_tagged_text(tuples):
     """
-    Create a list of tuples containing words of the text and its sentiment.
+    Generate tuples containing words of the text and its sentiment.
 
-    :param tuples: Tuples with text (as strings) and its sentiment
-    :return tuples_text: The list of tuples
+    The words are made by tokenizer.tokenize, like the words of the
+    classified comments.
+    :param tuples: Iterable of tuples with text (as strings) and its sentiment
+    :return: Generator of (words, sentiment) tuples
     """
-    tuple_text = []
-    stop = stopwords.words('english')
     for (text, sentiment) in tuples:
-        words = text.split()
-        clean_word = ([i.lower() for i in words
-                       if not i.lower() in stop])
-        tuple_text.append((clean_word, sentiment))
-    return tuple_text
+        yield tokenizer.tokenize(text), sentiment
 
 
 class SentimentAnalysis:
 
     """ Class for making sentiment analysis of video comments. """
 
-    def __init__(self, file_name):
-        """ Call the load method to load the classifier from file. """
-        corpus_path = "data/corpus.txt"
+    def __init__(self, file_name, corpus_path="data/corpus.txt",
+                 processes=1, chunk_size=2000, trace_memory=False):
+        """
+        Call the load method to load the classifier from file.
+
+        The corpus is only read if there is no classifier to load and a new
+        one has to be trained.
+
+        :param file_name: Path of the model file
+        :param corpus_path: Path of the corpus to train on
+        :param processes: Number of worker processes classifying comments,
+                          1 classifies in this process
+        :param chunk_size: Number of comments sent to a worker at a time.
+                           Comment lists smaller than two chunks are
+                           classified in this process
+        :param trace_memory: Trace the peak memory of a training with
+                             tracemalloc, which makes it several times
+                             slower
+        """
         self.logger = logging.getLogger(__name__)
-        _, self.word_list = self.create_words_and_tuples(corpus_path)
         self.file_path = os.path.join(os.path.dirname(__file__), file_name)
+        self.training_stats = None
+        self.trace_memory = trace_memory
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._pool = None
         self.classifier = self.load_classifier(corpus_path)
 
+    @property
+    def word_list(self):
+        """ The words of the corpus, as stored with the classifier. """
+        return self.classifier.vocabulary
+
     def load_corpus(self, file_name, split=","):
         """
-        Load corpus from file and stores it in a tuple.
+        Load corpus from file, one line at a time.
+
+        The lines are read and parsed as they are consumed, so the corpus is
+        never held in memory.
 
         :param file_name: Name of the corpus file
         :param split: How to split a line in the corpus (text vs. sentiment).
                       Default split: ','
-        :return: pt and nt: Respectively positive and negative tuple
-                            (text, sentiment)
+        :return: Generator of (text, sentiment) tuples
         """
         self.logger.debug("Loading corpus file")
         file_path = os.path.join(os.path.dirname(__file__), file_name)
         try:
-            with open(file_path, 'r') as read_file:
-                lines = read_file.readlines()[1:]
-        except(FileExistsError, LookupError):
+            read_file = open(file_path, 'r')
+        except (OSError, LookupError):
             self.logger.error("I/O error: corpus file not found")
             raise
-        else:
-            sentiment_dict = {0: "negative", 1: "positive"}
-            return [(line.split(split)[1].strip(),
-                     sentiment_dict[int(line.split(split)[0])])
-                    for line in lines]
-
-    def _word_feats_extractor(self, doc):
-        """
-        Extract features from corpus.
-
-        :param words: List of words from corpus
-        :return: Dict of the words as keys and True/False as values
-        """
-        doc_words = set(doc)
-        return dict([("contains({})".format(i), i in doc_words)
-                     for i in self.word_list])
-
-    def create_words_and_tuples(self, corpus_filename):
-        """
-        load corpus and create tagged text and word_list.
-
-        tagged text is the words of the text and their sentiment,
-        word_list is the words in the corpus
-
-        :param corpus_filename: the filepath of the corpus
-        """
-        text = self.load_corpus(corpus_filename, ";")
-        tagged_text = create_tagged_text(text)
-        word_list = create_word_list(tagged_text)
-        return tagged_text, word_list
+        sentiment_dict = {0: "negative", 1: "positive"}
+        with read_file:
+            # skip the header line
+            next(read_file, None)
+            for line in read_file:
+                fields = line.split(split, 2)
+                yield fields[1].strip(), sentiment_dict[int(fields[0])]
 
     def _train(self, corpus_filename):
         """
@@ -121,80 +143,139 @@ class SentimentAnalysis:
         Training the Naïve Bayes classifier, by calling the following methods:
         - load_corpus
         - create_tagged_text
-        - create_word_list
-        - word_feats_extractor
+        and counting the documents of each word and label in a single pass.
+        The corpus is streamed, so the memory used depends on the size of
+        the vocabulary and not on the size of the corpus.
+        The wall-time of the training is logged and kept in training_stats,
+        with its peak memory if trace_memory is set. The time of a traced
+        training includes the slowdown of tracemalloc.
         """
-        tagged_text, _ = self.create_words_and_tuples(corpus_filename)
-
-        self.logger.debug("Making training set (apply features)...")
-
-        training_set = nltk.classify.apply_features(
-            self._word_feats_extractor, tagged_text)
-
-        classifier = nltk.NaiveBayesClassifier.train(training_set)
+        # a caller already tracing keeps its tracing, only its peak is reset
+        tracing = tracemalloc.is_tracing()
+        if self.trace_memory and tracing:
+            tracemalloc.reset_peak()
+        elif self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+
+        self.logger.debug("Counting words and labels of the corpus...")
+        counts = naive_bayes.NaiveBayesCounts()
+        for words, label in create_tagged_text(
+                self.load_corpus(corpus_filename, ";")):
+            counts.add(words, label)
+        classifier = counts.to_scorer()
+
+        seconds = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+            self.logger.info("Classifier trained in %.2f seconds (traced), "
+                             "peak memory %.1f MiB", seconds, peak / 2 ** 20)
+        else:
+            self.logger.info("Classifier trained in %.2f seconds", seconds)
+        self.training_stats = {"seconds": seconds, "peak_memory": peak,
+                               "traced": self.trace_memory}
         self._save_classifier(classifier)
         return classifier
 
     def _save_classifier(self, classifier):
         """
-        Save the classifier to a pickle file.
+        Save the classifier to a model file.
 
         :param classifier: The trained classifier
         """
         try:
-            file_open = open(self.file_path, 'wb')
-            pickle.dump(classifier, file_open, 1)
-            file_open.close()
+            classifier.save(self.file_path)
             self.logger.info("Classifier saved successfully!")
         except IOError:
-            self.logger.debug("Couldn't save the classifier to pickle")
+            self.logger.debug("Couldn't save the classifier to model file")
 
     def load_classifier(self, corpus_path):
         """
         Load a trained classifier from file.
 
-        If it fails, it's training a new
+        The model file is memory mapped, so it is shared between the
+        processes loading it. If it fails, it's training a new
         """
         try:
-            classifier = nltk.data.load(
-                "file:"+self.file_path, 'pickle', 1)
+            classifier = naive_bayes.NaiveBayesScorer.load(self.file_path)
             self.logger.info("Classifier loaded!")
             return classifier
-        except (FileExistsError, LookupError):
-            self.logger.error("I/O error: classifier file not found")
+        except (OSError, ValueError) as err:
+            self.logger.warning("cannot load classifier: %s", err)
             self.logger.info("Will train a classifier")
             return self._train(corpus_path)
 
-    def classify_comments(self, comments):
+    def _get_pool(self):
         """
-        Classify youtube-videos comments.
+        Return the worker pool, starting it the first time.
 
-        performs classification on each comment
-        and let the method 'eval' make a decision
-        It normalize the ratio between number of positive and negative comments
-        before calling the 'eval' method
-        :param comments: The comments of youtube-video
-        :return:
+        :return: The multiprocessing pool
         """
-        video_sentiment = models.VideoSentiment(id=comments[0].video_id,
-                                                n_pos=0, n_neg=0, result="")
+        if self._pool is None:
+            self.logger.info("Starting %d classifier processes",
+                             self.processes)
+            classifier = self.classifier
+            self._pool = multiprocessing.Pool(
+                self.processes, initializer=_init_worker,
+                initargs=(classifier.labels, classifier.vocabulary,
+                          classifier.log_priors, classifier.likelihoods))
+        return self._pool
+
+    def close(self):
+        """ Stop the worker processes, if they are running. """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _classify_many(self, contents):
+        """
+        Classify comment contents, in the worker pool if worth it.
 
-        self.logger.info(
-            "There is a change in comments. We do sentiment analysis")
-        comments_sentiment = []
-        for comment in comments:
-            res = self.classifier.classify(self._word_feats_extractor(
-                comment.content.split()))
-
-            if res == "pos":
-                video_sentiment.n_pos += 1
-                comments_sentiment.append(models.CommentSentiment(
-                    id=comment.id, video_id=comment.video_id, positive=1))
-            else:
-                video_sentiment.n_neg += 1
-                comments_sentiment.append(models.CommentSentiment(
-                    id=comment.id, video_id=comment.video_id, positive=0))
+        :param contents: List of comment contents
+        :return: List with the label of each content, in the same order
+        """
+        if self.processes > 1 and len(contents) >= 2 * self.chunk_size:
+            chunks = [contents[i:i + self.chunk_size]
+                      for i in range(0, len(contents), self.chunk_size)]
+            return [label for labels in
+                    self._get_pool().map(_classify_contents, chunks)
+                    for label in labels]
+        return _classify_contents(contents, self.classifier)
+
+    def classify_comment_sentiments(self, comments):
+        """
+        Classify youtube-videos comments, all of them in one batch.
+
+        The comments are scored together by the compiled classifier, in
+        chunks in the worker pool if there are enough of them.
+        :param comments: The comments to classify
+        :return: List with the CommentSentiment of each comment
+        """
+        labels = self._classify_many([comment.content
+                                      for comment in comments])
+        return [models.CommentSentiment(id=comment.id,
+                                        video_id=comment.video_id,
+                                        positive=int(label in
+                                                     POSITIVE_LABELS))
+                for comment, label in zip(comments, labels)]
+
+    def video_sentiment(self, video_id, n_pos, n_neg):
+        """
+        Make the sentiment of a video from its number of comment sentiments.
 
+        It normalize the ratio between number of positive and negative comments
+        before calling the 'eval' method
+        :param video_id: The id of the youtube-video
+        :param n_pos: Number of positive comments
+        :param n_neg: Number of negative comments
+        :return: The VideoSentiment
+        """
+        video_sentiment = models.VideoSentiment(id=video_id, n_pos=n_pos,
+                                                n_neg=n_neg, result="")
         total_data = video_sentiment.n_pos + video_sentiment.n_neg
         self.logger.debug("Number of negative comments: %d",
                           video_sentiment.n_neg)
@@ -212,6 +293,23 @@ class SentimentAnalysis:
         video_sentiment.result = self._eval(video_sentiment)
         self.logger.info("The result of the video: %s",
                          video_sentiment.result)
+        return video_sentiment
+
+    def classify_comments(self, comments):
+        """
+        Classify youtube-videos comments.
+
+        performs classification on each comment
+        and let the method 'eval' make a decision
+        :param comments: The comments of youtube-video
+        :return: Tuple of the VideoSentiment and the list of CommentSentiments
+        """
+        self.logger.info(
+            "There is a change in comments. We do sentiment analysis")
+        comments_sentiment = self.classify_comment_sentiments(comments)
+        n_pos = sum(com.positive for com in comments_sentiment)
+        video_sentiment = self.video_sentiment(
+            comments[0].video_id, n_pos, len(comments_sentiment) - n_pos)
         return video_sentiment, comments_sentiment
 
     def _eval(self, video_sentiment):
@@ -3,3 +3,51 @@ function showSpinner()
   var spinner = document.getElementById("squaresWaveG");
   spinner.style.visibility = "visible";
 }
+
+function pollStatus(videoId)
+{
+  var request = new XMLHttpRequest();
+  request.onload = function()
+  {
+    // the jobs are only known to the process running them, after a restart
+    // or from another process the job is not found
+    if (request.status !== 200)
+    {
+      var error = request.statusText;
+      try
+      {
+        error = JSON.parse(request.responseText).error || error;
+      }
+      catch (e)
+      {
+        // not JSON, such as an error page of a proxy
+      }
+      document.getElementById("job-state").textContent = "Error: " + error +
+        ", reload the page to see the result or analyse the video again";
+      return;
+    }
+    var status = JSON.parse(request.responseText);
+    document.getElementById("pages-fetched").textContent = status.pages_fetched;
+    document.getElementById("comments-classified").textContent = status.comments_classified;
+    if (status.state === "done")
+    {
+      window.location.reload();
+    }
+    else if (status.state === "failed")
+    {
+      document.getElementById("job-state").textContent = "Error: " + status.error;
+    }
+    else
+    {
+      document.getElementById("job-state").textContent = "Status: " + status.state;
+      setTimeout(function() { pollStatus(videoId); }, 1000);
+    }
+  };
+  request.onerror = function()
+  {
+    document.getElementById("job-state").textContent =
+      "Error: the status could not be fetched, reload the page to try again";
+  };
+  request.open("GET", "/status?video_id=" + encodeURIComponent(videoId));
+  request.send();
+}
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module for splitting texts into the words the classifier uses.
+
+The classifier is trained on the words of the corpus and classifies the
+words of the comments, both made by tokenize, so the two agree. A text is
+lowercased once and split on whitespace, and the stop words are dropped by
+a lookup in a frozenset.
+"""
+from nltk.corpus import stopwords
+
+# words dropped besides the english stop words of nltk
+CUSTOM_STOP_WORDS = ('band', 'they', 'them')
+# read from the nltk stopwords corpus by stop_words
+_STOP_WORDS = None
+
+
+def stop_words():
+    """
+    Return the stop words, reading them the first time.
+
+    :return: frozenset of the lowercase stop words
+    """
+    global _STOP_WORDS  # pylint: disable=global-statement
+    if _STOP_WORDS is None:
+        _STOP_WORDS = frozenset(word.lower() for word in
+                                stopwords.words('english') +
+                                list(CUSTOM_STOP_WORDS))
+    return _STOP_WORDS
+
+
+def tokenize(text):
+    """
+    Split a text into its lowercase words, without the stop words.
+
+    :param text: the text
+    :return: list of the words
+    """
+    stop = stop_words()
+    return [word for word in text.lower().split() if word not in stop]
+
+
+def tokenize_many(texts):
+    """
+    Split texts into their lowercase words, without the stop words.
+
+    :param texts: iterable of texts
+    :return: list with the list of words of each text
+    """
+    stop = stop_words()
+    return [[word for word in text.lower().split() if word not in stop]
+            for text in texts]
@@ -7,54 +7,154 @@ handles the interacting between the user and the system.
 """
 import flask
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from matplotlib.colors import LogNorm
 from matplotlib.figure import Figure
+import datetime
+import functools
+import hashlib
 import io
-import urllib
-import urllib.parse
 import logging
+import os
+import threading
+import numpy
 import sqlalchemy
 
+import analysis
+import cache
 import database
+import instrumentation
+import jobs
 import models
+import profiling
 import sentiment_analysis
 import youtube
 
 logging.basicConfig(format="%(asctime)s %(message)s", level=logging.DEBUG)
 LOGGER = logging.getLogger(__name__)
 
-ANALYZER = sentiment_analysis.SentimentAnalysis("data/classifier.pickle")
+ANALYZER = sentiment_analysis.SentimentAnalysis("data/classifier.model")
 SCRAPER = youtube.YouTubeScraper()
+JOBS = jobs.JobManager(model_file="data/classifier.model")
+# rendered plots, keyed by the data they are drawn from
+PLOT_CACHE = cache.LRUCache(max_size=32 * 1024 * 1024)
+# summaries and density grids of the sentiments of categories
+DENSITY_CACHE = cache.LRUCache(max_size=8 * 1024 * 1024, max_entries=1024)
+# info of the videos, fetched from youtube or the database, by id
+VIDEO_INFO_CACHE = cache.LRUCache(max_size=4096)
+# rendered pages of the analysed videos, by id
+PAGE_CACHE = cache.LRUCache(max_size=16 * 1024 * 1024)
+analysis.SAVE_LISTENERS.append(PAGE_CACHE.remove)
+analysis.SAVE_LISTENERS.append(lambda _video_id: DENSITY_CACHE.clear())
 
 APP = flask.Flask(__name__)
+# analyse videos in background jobs instead of inside the request
+APP.config.setdefault("BACKGROUND_JOBS", True)
+# compared videos drawn one by one, their density is drawn above this
+APP.config.setdefault("SCATTER_LIMIT", 2000)
+APP.config.setdefault("DENSITY_BINS", 50)
+# seconds the summary and density of a category are used before they are
+# counted again, sentiments saved by this process count them again at once
+APP.config.setdefault("DENSITY_TTL", 60)
+# seconds the info of a video is used before it is fetched again
+APP.config.setdefault("VIDEO_INFO_TTL", 600)
+# time the stages of each request, see instrumentation
+APP.config.setdefault("INSTRUMENTATION", False)
+# directory of the request profiles, see profiling (None = no profiling)
+APP.config.setdefault("PROFILE_DIR", None)
+# profile one in this many requests (0 = only the ones asking for it)
+APP.config.setdefault("PROFILE_SAMPLE", 0)
+# secret a request sends in X-Profile to be profiled (None = only sampled)
+APP.config.setdefault("PROFILE_TOKEN", None)
+# number of the newest profiles kept
+APP.config.setdefault("PROFILE_KEEP", 50)
+# set once the database of this process is created and migrated
+_DATABASE_READY = threading.Event()
+_DATABASE_LOCK = threading.Lock()
+
+
+@APP.before_request
+def setup_database():
+    """
+    Create and migrate the database before the first request.
+
+    Runs in every process serving the app, also when it is served by a
+    WSGI server instead of being run as a script.
+    """
+    if _DATABASE_READY.is_set():
+        return
+    with _DATABASE_LOCK:
+        if not _DATABASE_READY.is_set():
+            database.init_db()
+            _DATABASE_READY.set()
+
+
+@APP.before_request
+def start_instrumentation():
+    """ Start recording the stages of the request, if instrumented. """
+    if APP.config["INSTRUMENTATION"]:
+        instrumentation.start_request()
 
 
-def save_sentiment(video_sentiment, comments_sentiment):
+@APP.after_request
+def finish_instrumentation(response):
     """
-    helper function for saving sentiments in the database.
+    Add the times of the stages of the request to the response.
 
-    Saves the results of sentiment analysis to the database.
-    The result of each comment and for the whole video is saved
-    :param video_sentiment: sentiment result for the whole video:
-    number of pos and neg comments (normalized) and final verdict of the video
-    :param comments_sentiment: comments of the video with their sentiments
+    :param response: the response of the request
+    :return: the response, with a Server-Timing header if instrumented
     """
-    db_sentiments = database.DB_SESSION.query(models.CommentSentiment).filter(
-        models.CommentSentiment.video_id == video_sentiment.id).all()
-    db_comment_sentiment_ids = [db_comment.id for db_comment in db_sentiments]
+    timing = instrumentation.finish_request(flask.request.endpoint or "")
+    if timing is not None:
+        response.headers["Server-Timing"] = \
+            instrumentation.server_timing(*timing)
+    return response
+
 
-    for comment_sentiment in comments_sentiment:
-        if comment_sentiment.id not in db_comment_sentiment_ids:
-            database.DB_SESSION.add(comment_sentiment)
+@APP.teardown_request
+def discard_instrumentation(_error):
+    """ Stop recording a request that failed before after_request. """
+    instrumentation.finish_request(flask.request.endpoint or "")
 
-    db_videosentiment = database.DB_SESSION.query(
-        models.VideoSentiment).filter(
-            models.VideoSentiment.id == video_sentiment.id).first()
 
-    if db_videosentiment:
-        db_videosentiment = database.DB_SESSION.merge(video_sentiment)
-    else:
-        database.DB_SESSION.add(video_sentiment)
-    database.DB_SESSION.commit()
+def profiled(handler):
+    """
+    Decorate a request handler, profiling the requests that are wanted.
+
+    Profiling is off unless APP.config["PROFILE_DIR"] is set. A request
+    asks for a profile by sending APP.config["PROFILE_TOKEN"], other
+    requests are only sampled. The name of a profile is sent in the
+    X-Profile header of the response.
+    :param handler: the request handler
+    :return: the decorated handler
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        """ Run the handler, under the profiler if wanted. """
+        directory = APP.config["PROFILE_DIR"]
+        if not directory or not profiling.wanted(
+                flask.request, APP.config["PROFILE_SAMPLE"],
+                APP.config["PROFILE_TOKEN"]):
+            return handler(*args, **kwargs)
+        result, path = profiling.run(
+            lambda: flask.make_response(handler(*args, **kwargs)),
+            directory, flask.request.endpoint, APP.config["PROFILE_KEEP"])
+        if path is not None:
+            LOGGER.info("profile of %s written to %s", flask.request.path,
+                        path)
+            result.headers[profiling.HEADER] = os.path.basename(path)
+        return result
+    return wrapper
+
+
+@APP.route("/metrics")
+def metrics():
+    """
+    Serve the histograms of the request and stage times.
+
+    :return: the histograms in the Prometheus text format
+    """
+    return flask.Response(instrumentation.REGISTRY.render(),
+                          mimetype="text/plain; version=0.0.4")
 
 
 @APP.route("/")
@@ -77,7 +177,65 @@ def about():
     return flask.render_template("about.html")
 
 
+def _plain_info(video_info, categories):
+    """
+    Return the info of a video as plain values.
+
+    :param video_info: the Video
+    :param categories: the VideoCategories of the video
+    :return: tuple of the column values of the Video and the types of its
+             categories
+    """
+    return ({column.name: getattr(video_info, column.name)
+             for column in models.Video.__table__.columns},
+            [category.type for category in categories])
+
+
+def _videoinfo(video_id, db_video_info):
+    """
+    Return the info of a video, fetching it from youtube only when stale.
+
+    The info fetched from youtube is kept in VIDEO_INFO_CACHE. Info that
+    was fetched less than APP.config["VIDEO_INFO_TTL"] seconds ago, in the
+    cache or stored with a sentiment in the database, is used as it is,
+    so num_of_comments is only revalidated after that window.
+    :param video_id: the id of the video
+    :param db_video_info: the stored Video, None if there is none
+    :return: tuple of a new Video and its new VideoCategories
+    :raises ValueError: if the video id is invalid
+    :raises RuntimeError: if the video info could not be fetched
+    """
+    ttl = datetime.timedelta(seconds=APP.config["VIDEO_INFO_TTL"])
+    now = datetime.datetime.now()
+    cached = VIDEO_INFO_CACHE.get(video_id)
+    if cached is None or now - cached[0] > ttl:
+        has_sentiment = database.DB_SESSION.query(
+            models.VideoSentiment.id).filter(
+                models.VideoSentiment.id == video_id).first()
+        if db_video_info and has_sentiment and \
+                now - db_video_info.timestamp <= ttl:
+            LOGGER.debug("using stored info of video %r", video_id)
+            video_info = db_video_info
+            categories = database.DB_SESSION.query(
+                models.VideoCategory).filter(
+                    models.VideoCategory.video_id == video_id).all()
+            fetched = db_video_info.timestamp
+        else:
+            with instrumentation.span("fetch_videoinfo"):
+                video_info, categories = SCRAPER.fetch_videoinfo(video_id)
+            fetched = now
+        # the cache keeps plain values, the objects it returns are new so
+        # they can be added to any session
+        cached = (fetched,) + _plain_info(video_info, categories)
+        VIDEO_INFO_CACHE.put(video_id, cached, size=1)
+    _, columns, types = cached
+    return models.Video(**columns), [models.VideoCategory(video_id=video_id,
+                                                          type=category)
+                                     for category in types]
+
+
 @APP.route("/video")
+@profiled
 def video():
     """
     Video analysis page.
@@ -89,65 +247,78 @@ def video():
     :return: The video page (video.html) with the result from database or
             classification.
     """
-    video_id = flask.request.args.get("video_id")
-    # if in the form of an url, extract id
-    if "youtube" in video_id:
-        url = urllib.parse.urlparse(video_id)
-        query = dict(urllib.parse.parse_qsl(url[4]))
-        video_id = query["v"]
-
-    db_video_info = database.DB_SESSION.query(models.Video).filter(
-        models.Video.id == video_id).first()
     try:
-        video_info, categories = SCRAPER.fetch_videoinfo(video_id)
+        # if in the form of an url, extract id
+        video_id = youtube.video_id_from_input(
+            flask.request.args.get("video_id", ""))
+        db_video_info = database.DB_SESSION.query(models.Video).filter(
+            models.Video.id == video_id).first()
+        video_info, categories = _videoinfo(video_id, db_video_info)
     except ValueError:
         return flask.render_template("error.html",
                                      error="invalid video id")
     except RuntimeError as err:
         return flask.render_template("error.html", error=str(err))
 
+    sentiment = None
     if (db_video_info and
             db_video_info.num_of_comments == video_info.num_of_comments):
+        # the video is stored before its sentiment, while its job is running
+        # or after it has failed there is no sentiment to show
+        with instrumentation.span("load_sentiment"):
+            sentiment = database.DB_SESSION.query(
+                models.VideoSentiment).filter(
+                    models.VideoSentiment.id == video_id).first()
+    if sentiment is not None:
         LOGGER.info("sentiment for video with id: %r found in database",
                     video_id)
+        # the stored video changes when a job analyses the video again, the
+        # shown info when it is fetched again after VIDEO_INFO_TTL
+        version = (db_video_info.timestamp, db_video_info.num_of_comments,
+                   tuple(sorted(_plain_info(video_info, [])[0].items())))
+        cached = PAGE_CACHE.get(video_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        with instrumentation.span("load_sentiment"):
+            num_of_comments = analysis.comment_count(video_id)
+        with instrumentation.span("render_template"):
+            page = flask.render_template("video.html", video={
+                "sentiment": sentiment, "video_info": video_info,
+                "num_of_comments": num_of_comments})
+        PAGE_CACHE.put(video_id, (version, page), size=len(page))
+        return page
+    if APP.config["BACKGROUND_JOBS"]:
+        LOGGER.info("queueing new video with id: %r", video_id)
+        # the job stores the info the page compares with, fetching it again
+        # could store another number of comments
+        status = JOBS.submit(video_id, _plain_info(video_info, categories))
+        return flask.render_template("processing.html", status=status)
+
+    LOGGER.info("processing new video with id: %r", video_id)
+    try:
+        sentiment, num_of_comments = analysis.analyse_video(
+            video_id, video_info, categories, SCRAPER, ANALYZER)
+    except RuntimeError as err:
+        return flask.render_template("error.html", error=str(err))
 
-        sentiment = database.DB_SESSION.query(models.VideoSentiment).filter(
-            models.VideoSentiment.id == video_id).first()
-
-        comments = database.DB_SESSION.query(models.Comment).filter(
-            models.Comment.video_id == video_id).all()
-    else:
-        LOGGER.info("processing new video with id: %r", video_id)
-        if db_video_info:
-            db_video_info = database.DB_SESSION.merge(video_info)
-        else:
-            database.DB_SESSION.add(video_info)
-            database.DB_SESSION.add_all(categories)
-        try:
-            comments = SCRAPER.fetch_comments(video_id)
-        except RuntimeError as err:
-            return flask.render_template("error.html", error=str(err))
-
-        # get unique comments only
-        unique_ids = set([comment.id for comment in comments])
-        comments = [next(com for com in comments if com.id == com_id)
-                    for com_id in unique_ids]
-
-        for comment in comments:
-            comment_in_db = database.DB_SESSION.query(models.Comment).filter(
-                models.Comment.id == comment.id).first()
-
-            if not comment_in_db:
-                database.DB_SESSION.add(comment)
+    video_dict = {"sentiment": sentiment, "video_info": video_info,
+                  "num_of_comments": num_of_comments}
+    with instrumentation.span("render_template"):
+        return flask.render_template("video.html", video=video_dict)
 
-        database.DB_SESSION.commit()
 
-        sentiment, comment_sentiments = ANALYZER.classify_comments(comments)
+@APP.route("/status")
+def status():
+    """
+    Report the progress of the background job of a video.
 
-        save_sentiment(sentiment, comment_sentiments)
-    video_dict = {"sentiment": sentiment, "video_info": video_info,
-                  "num_of_comments": len(comments)}
-    return flask.render_template("video.html", video=video_dict)
+    :return: JSON with the job status, 404 if the video has no job
+    """
+    job_status = JOBS.status(flask.request.args.get("video_id"))
+    if job_status is None:
+        return flask.jsonify(error="no job for video"), 404
+    return flask.jsonify(job_status)
 
 
 @APP.errorhandler(404)
@@ -170,38 +341,126 @@ def previous():
     return flask.render_template("previous.html", latest=latest)
 
 
+def _render_png(fig):
+    """
+    Render a figure.
+
+    :param fig: the matplotlib Figure
+    :return: the PNG file as bytes
+    """
+    canvas = FigureCanvas(fig)
+    output = io.BytesIO()
+    canvas.print_png(output)
+    return output.getvalue()
+
+
+def _png_response(key, render):
+    """
+    Create the response for a plot, rendering it only if it is not cached.
+
+    The key is made of the data the plot is drawn from, so it is also the
+    ETag of the plot. A browser revalidating a plot it has the current
+    version of gets a 304 without the plot being rendered.
+    :param key: tuple identifying the plot and the version of its data
+    :param render: function returning the PNG file as bytes
+    :return: the PNG response
+    """
+    etag = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+    if etag in flask.request.if_none_match:
+        response = flask.Response(status=304)
+        response.set_etag(etag)
+        return response
+    cached = PLOT_CACHE.get(key)
+    if cached is None:
+        last_modified = datetime.datetime.now(datetime.timezone.utc).replace(
+            microsecond=0)
+        with instrumentation.span("render_plot"):
+            cached = (render(), last_modified)
+        PLOT_CACHE.put(key, cached, size=len(cached[0]))
+    png, last_modified = cached
+    response = flask.make_response(png)
+    response.mimetype = "image/png"
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # the plot changes with the data, so it is revalidated on every use
+    response.cache_control.no_cache = True
+    return response.make_conditional(flask.request)
+
+
 @APP.route("/comment_sentiment_plot.png")
 def comment_sentiment_plot():
     """
     Create comment sentiment plot.
 
-    Creating the histogram-plot for the sentiments of the comments of the video
-    :return: PNG file showing the histogram
+    Creating the bar chart of the number of positive and negative comments
+    of the video, counted by the database
+    :return: PNG file showing the bar chart
     """
     video_id = flask.request.args.get("video_id")
-    fig = Figure(figsize=(5, 5))
-    axis = fig.add_subplot(1, 1, 1)
-    fig.patch.set_alpha(0)
-
-    query = database.DB_SESSION.query(models.CommentSentiment).filter(
-        models.CommentSentiment.video_id == video_id).all()
-    positive = [q.positive for q in query if q.positive]
-    negative = [q.positive for q in query if not q.positive]
-
-    if positive:
-        axis.hist(positive, color=["g"], align="left", bins=[0, 1])
-    if negative:
-        axis.hist(negative, color=["r"], align="right", bins=[0, 1])
-    axis.set_xlabel("positive        negative")
-    axis.set_xticks([])
-    axis.set_title("comment sentiment distribution")
-    axis.set_ylabel("number of comments")
-    canvas = FigureCanvas(fig)
-    output = io.BytesIO()
-    canvas.print_png(output)
-    response = flask.make_response(output.getvalue())
-    response.mimetype = 'image/png'
-    return response
+    n_pos, n_neg = analysis.comment_sentiment_counts(video_id)
+
+    def render():
+        """ Render the bar chart. """
+        fig = Figure(figsize=(5, 5))
+        axis = fig.add_subplot(1, 1, 1)
+        fig.patch.set_alpha(0)
+        axis.bar([0, 1], [n_pos, n_neg], width=1, color=["g", "r"])
+        axis.set_xlabel("positive        negative")
+        axis.set_xticks([])
+        axis.set_title("comment sentiment distribution")
+        axis.set_ylabel("number of comments")
+        return _render_png(fig)
+
+    return _png_response(("comment_sentiment", video_id, n_pos, n_neg),
+                         render)
+
+
+def _widen(low, high):
+    """
+    Return a range of values, widened if it is empty.
+
+    :param low: the smallest value
+    :param high: the largest value
+    :return: tuple of the low and high end of the range
+    """
+    if high > low:
+        return low, high
+    return low - 0.5, high + 0.5
+
+
+def _category_density(categories, bins):
+    """
+    Return the summary and density grid of the sentiments of categories.
+
+    Both are cached by the categories, for all the videos compared with
+    them, and counted again after APP.config["DENSITY_TTL"] seconds or when
+    a sentiment is saved. The grid is only counted when there are more
+    sentiments than APP.config["SCATTER_LIMIT"].
+    :param categories: the sorted categories, all videos if empty
+    :param bins: number of bins along each axis
+    :return: tuple of the analysis.sentiment_summary, the n_pos and n_neg
+             ranges of the grid, and the grid (n_pos bins x n_neg bins) of
+             the number of sentiments, None if they are drawn one by one
+    """
+    key = (tuple(categories), bins, APP.config["SCATTER_LIMIT"])
+    ttl = datetime.timedelta(seconds=APP.config["DENSITY_TTL"])
+    now = datetime.datetime.now()
+    cached = DENSITY_CACHE.get(key)
+    if cached is None or now - cached[0] > ttl:
+        query = analysis.category_sentiments(categories)
+        summary = analysis.sentiment_summary(query)
+        extent = None
+        grid = None
+        if summary[0] > APP.config["SCATTER_LIMIT"]:
+            extent = _widen(*summary[1:3]) + _widen(*summary[3:5])
+            grid = numpy.zeros((bins, bins))
+            for (pos_bin, neg_bin), count in analysis.sentiment_density(
+                    query, extent, bins).items():
+                grid[pos_bin, neg_bin] = count
+        cached = (now, summary, extent, grid)
+        DENSITY_CACHE.put(key, cached,
+                          size=1 if grid is None else grid.nbytes)
+    return cached[1:]
 
 
 @APP.route("/video_sentiment_plot.png")
@@ -210,33 +469,54 @@ def video_sentiment_plot():
     Create video sentiment plot.
 
     Creating a scatter-plot for the sentiments of the video against other
-    videos with the same youtube-category
+    videos with the same youtube-category. When there are more of them than
+    APP.config["SCATTER_LIMIT"], the density of the videos of the
+    categories is drawn instead.
     :return: PNG file showing the scatter-plot
     """
     video_id = flask.request.args.get("video_id")
-    fig = Figure(figsize=(5, 5))
-    axis = fig.add_subplot(1, 1, 1)
-    fig.patch.set_alpha(0)
-
-    videos = database.DB_SESSION.query(models.VideoSentiment).all()
-
     current_video = database.DB_SESSION.query(models.VideoSentiment).filter(
         models.VideoSentiment.id == video_id).first()
+    if current_video is None:
+        flask.abort(404)
+    categories, query = analysis.comparison_sentiments(video_id)
+    bins = APP.config["DENSITY_BINS"]
+    # changes whenever one of the sentiments of the categories is added or
+    # updated
+    summary, extent, grid = _category_density(categories, bins)
+    density = grid is not None
+    label = "previously analysed{}".format(
+        " ({})".format(", ".join(categories)) if categories else "")
+
+    def render():
+        """ Render the scatter-plot. """
+        fig = Figure(figsize=(5, 5))
+        axis = fig.add_subplot(1, 1, 1)
+        fig.patch.set_alpha(0)
+        if density:
+            mesh = axis.pcolormesh(
+                numpy.linspace(extent[0], extent[1], bins + 1),
+                numpy.linspace(extent[2], extent[3], bins + 1),
+                numpy.ma.masked_equal(grid.T, 0), cmap="Blues",
+                norm=LogNorm())
+            fig.colorbar(mesh, ax=axis, label="videos")
+            axis.scatter([], [], color="blue", marker="s", label=label)
+        else:
+            videos = query.all()
+            axis.scatter([v.n_pos for v in videos], [v.n_neg for v in videos],
+                         color="blue", marker="x", label=label)
+        axis.scatter(current_video.n_pos, current_video.n_neg,
+                     color="black", marker="o", label=video_id)
+        axis.set_title("video sentiment comparison")
+        axis.set_xlabel("measure of positivity")
+        axis.set_ylabel("measure of negativity")
+        axis.legend()
+        return _render_png(fig)
+
+    return _png_response(("video_sentiment", video_id, current_video.n_pos,
+                          current_video.n_neg, tuple(categories), density) +
+                         summary, render)
 
-    axis.scatter([v.n_pos for v in videos], [v.n_neg for v in videos],
-                 color="blue", marker="x", label="previously analysed")
-    axis.scatter(current_video.n_pos, current_video.n_neg, color="black",
-                 marker="o", label=video_id)
-    axis.set_title("video sentiment comparison")
-    axis.set_xlabel("measure of positivity")
-    axis.set_ylabel("measure of negativity")
-    axis.legend()
-    canvas = FigureCanvas(fig)
-    output = io.BytesIO()
-    canvas.print_png(output)
-    response = flask.make_response(output.getvalue())
-    response.mimetype = 'image/png'
-    return response
 
 if __name__ == "__main__":
     APP.run(debug=True)
@@ -2,101 +2,292 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=R0201
 """ This module scrapes/download contents from a youtube video. """
+import concurrent.futures
 import requests
+import requests.adapters
+import urllib3.util.retry
 import dateutil.parser
 import logging
 import datetime
+import os
+import urllib.parse
 
 import models
 
+# comments per page of the gdata comments feed
+PAGE_SIZE = 50
+# the videos feed of gdata, SENTIMENTUBE_GDATA_URL points the scrapers at
+# another server, such as the stand-in of the benchmarks
+GDATA_URL = os.environ.get("SENTIMENTUBE_GDATA_URL",
+                           "https://gdata.youtube.com/feeds/api/videos")
+# the error shown when gdata could not be reached, also after the failed
+# requests were retried
+UNREACHABLE = "YouTube could not be reached, please try again later"
+
+
+def video_id_from_input(text):
+    """
+    Get the video id from a video id or a youtube url.
+
+    Parameters:
+    - text : the video id, or the url of the video
+
+    Returns:
+    - the video id
+
+    Raises:
+    - ValueError : if the url has no video id
+    """
+    if "youtube" in text:
+        url = urllib.parse.urlparse(text)
+        query = dict(urllib.parse.parse_qsl(url[4]))
+        if "v" not in query:
+            raise ValueError("no video id in url {}".format(text))
+        return query["v"]
+    return text
+
+
+def is_known(comment, since):
+    """
+    Check if a comment is the stored comment or older than it.
+
+    The stored publish times have lost their timezone in the database, so
+    the times are compared without it.
+
+    Parameters:
+    - comment : the fetched Comment
+    - since : the newest stored Comment
+
+    Returns:
+    - True if the comment is already stored
+    """
+    return comment.id == since.id or \
+        comment.published.replace(tzinfo=None) < \
+        since.published.replace(tzinfo=None)
+
 
 class YouTubeScraper:
 
     """ Class for communicating with the gdata youtube API. """
 
-    def __init__(self):
-        """ Set the gdata youtube urls and the logger. """
-        self.comment_url = "https://gdata.youtube.com/feeds/api/videos/{0}/" \
-                           "comments"
-        self.video_url = "https://gdata.youtube.com/feeds/api/videos/{0}"
+    def __init__(self, concurrency=1, retries=3, backoff=0.5,
+                 max_requests=0, base_url=None):
+        """
+        Set the gdata youtube urls, the HTTP session and the logger.
+
+        The session keeps the connections to gdata alive between requests
+        and retries failed requests with exponential backoff.
+
+        Parameters:
+        - concurrency : number of comment pages fetched at the same time
+        - retries : number of times a failed request is retried
+        - backoff : backoff factor in seconds between retries
+        - max_requests : maximum number of comment page requests for one
+                         video (0 = no maximum)
+        - base_url : url of the videos feed (None = GDATA_URL)
+        """
+        base_url = (base_url or GDATA_URL).rstrip("/")
+        self.comment_url = base_url + "/{0}/comments"
+        self.video_url = base_url + "/{0}"
         self.logger = logging.getLogger(__name__)
+        self.concurrency = concurrency
+        self.max_requests = max_requests
+        self.session = requests.Session()
+        retry = urllib3.util.retry.Retry(
+            total=retries, backoff_factor=backoff,
+            status_forcelist=(500, 502, 503, 504))
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max(concurrency, 10), max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _fetch_feed(self, url, params, video_id):
+        """
+        Fetch one page of the gdata comments feed.
+
+        Parameters:
+        - url : the url of the page
+        - params : the query parameters of the page
+        - video_id : the id of the youtube video
 
-    def _comment_generator(self, video_id):
+        Returns:
+        - the json-converted feed of the page
+
+        Raises:
+        - RuntimeError : if gdata could not be reached
+        """
+        try:
+            response = self.session.get(url, params=params)
+        except requests.exceptions.RequestException as err:
+            self.logger.exception("_comment_generator: request failed")
+            raise RuntimeError(UNREACHABLE) from err
+        if not response:
+            error = "_comment_generator: invalid video id: " \
+                "{}".format(video_id)
+            self.logger.error(error)
+            raise ValueError(error)
+        return response.json()["feed"]
+
+    def _feed_generator(self, video_id, incremental=False):
+        """
+        A generator for fetching the pages of the gdata comments feed.
+
+        The first page is fetched alone. After it, the pages are fetched
+        by their start-index, concurrency pages at a time, or by following
+        the next links if concurrency is 1. At most max_requests pages are
+        fetched, unless the fetch is incremental.
+
+        Parameters:
+        - video_id : the id of the youtube video
+        - incremental : True if the paging stops at a stored comment
+        """
+        url = self.comment_url.format(video_id)
+        params = {"v": 2, "alt": "json", "max-results": PAGE_SIZE,
+                  "orderby": "published"}
+        requests_left = self.max_requests or float("inf")
+
+        feed = self._fetch_feed(url, params, video_id)
+        requests_left -= 1
+        yield feed
+        total = int(feed.get("openSearch$totalResults", {}).get("$t", 0))
+
+        def fetch_page(start_index):
+            """ Fetch the page starting at start_index. """
+            return self._fetch_feed(
+                url, dict(params, **{"start-index": start_index}), video_id)
+
+        if self.concurrency > 1 and total:
+            start_indexes = list(range(PAGE_SIZE + 1, total + 1, PAGE_SIZE))
+            with concurrent.futures.ThreadPoolExecutor(
+                    self.concurrency) as executor:
+                while start_indexes:
+                    if requests_left <= 0:
+                        if not self._budget_exceeded(video_id, incremental):
+                            return
+                        requests_left = float("inf")
+                    window = start_indexes[:int(min(self.concurrency,
+                                                    requests_left))]
+                    del start_indexes[:len(window)]
+                    requests_left -= len(window)
+                    for feed in executor.map(fetch_page, window):
+                        if "entry" not in feed:
+                            return
+                        yield feed
+        else:
+            while True:
+                next_url = [link["href"] for link in feed["link"]
+                            if link["rel"] == "next"]
+                if not next_url:
+                    return
+                if requests_left <= 0:
+                    if not self._budget_exceeded(video_id, incremental):
+                        return
+                    requests_left = float("inf")
+                feed = self._fetch_feed(next_url[0], params, video_id)
+                requests_left -= 1
+                yield feed
+
+    def _budget_exceeded(self, video_id, incremental):
+        """
+        Log that the request budget of a video ran out.
+
+        An incremental fetch goes on until the stored comment is reached:
+        the next fetch only asks for comments newer than the newest one
+        stored, so the comments left out would never be fetched.
+
+        Parameters:
+        - video_id : the id of the youtube video
+        - incremental : True if the paging stops at a stored comment
+
+        Returns:
+        - True if the paging goes on
+        """
+        if incremental:
+            self.logger.warning("_comment_generator: more than %d requests "
+                                "for video %s, paging on to the stored "
+                                "comment", self.max_requests, video_id)
+            return True
+        self.logger.warning("_comment_generator: stopped after %d requests "
+                            "for video %s", self.max_requests, video_id)
+        return False
+
+    def _comment_generator(self, video_id, since=None):
         """
         A generator for fetching one "page" of youtube comments.
 
         For a youtube video, it returns a list of comment dictionaries
         with keys: author_name, author_id, content, video_id, id, published
+        A comment already yielded on an earlier page (the pages shift when
+        comments are posted while paging) is left out.
         It should not be used directly, it is private and the fetch_comments
         method should be used instead.
 
         Parameters:
         - video_id : the id of the youtube video
+        - since : the newest already stored Comment of the video, paging
+                  stops when it (or an older comment) is reached
         """
-        next_url = self.comment_url.format(video_id)
-        params = {"v": 2, "alt": "json", "max-results": 50,
-                  "orderby": "published"}
-
-        while True:
-            if next_url:
-                try:
-                    response = requests.get(next_url, params=params)
-                except requests.exceptions.RequestException:
-                    self.logger.exception("_comment_generator: request failed")
-                    raise
-                else:
-                    if not response:
-                        error = "_comment_generator: invalid video id: " \
-                            "{}".format(video_id)
-                        self.logger.error(error)
-                        raise ValueError(error)
-                    response = response.json()
-            else:
-                raise StopIteration
+        seen = set()
+        for feed in self._feed_generator(video_id,
+                                         incremental=since is not None):
             comments = []
-            if "entry" not in response["feed"]:
+            if "entry" not in feed:
                 raise RuntimeError("no comments for video")
-            for comment in response["feed"]["entry"]:
-                author_name = comment["author"][0]["name"]["$t"]
-                author_id = comment["author"][0]["yt$userId"]["$t"]
-                content = comment["content"]["$t"]
-                comment_id = comment["id"]["$t"]
-                published = dateutil.parser.parse(comment["published"]["$t"])
-
-                comment = models.Comment(id=comment_id,
-                                         video_id=video_id,
-                                         author_id=author_id,
-                                         author_name=author_name,
-                                         content=content,
-                                         published=published)
-
-                comments.append(comment)
-            next_url = [link["href"] for link in response["feed"]["link"]
-                        if link["rel"] == "next"]
-            if next_url:
-                next_url = next_url[0]
+            for entry in feed["entry"]:
+                comment = self.extract_comment(entry, video_id)
+                if since is not None and is_known(comment, since):
+                    self.logger.debug("_comment_generator: reached stored "
+                                      "comment %s", comment.id)
+                    if comments:
+                        yield comments
+                    return
+                if comment.id not in seen:
+                    seen.add(comment.id)
+                    comments.append(comment)
             yield comments
 
-    def fetch_comments(self, video_id, number=0):
+    def fetch_comments(self, video_id, number=0, since=None, progress=None):
         """
         fetch a number of youtube comments using _comment_generator.
 
         Parameters:
         - video_id : the id of the youtube video
         - number : the number of comments to fetch (0 = all comments)
+        - since : the newest already stored Comment of the video, only
+                  comments published after it are fetched (None = all)
+        - progress : called with the number of pages fetched so far after
+                     each page
 
         Returns:
-        - list of Comment objects
+        - list of unique Comment objects, in the order of the feed
         """
         comments = []
-        fetch = self._comment_generator(video_id)
-        while True:
-            try:
-                comments += next(fetch)
-                if len(comments) > number and number > 0:
-                    return comments[:number]
-            except StopIteration:
-                return comments
+        for pages, page in enumerate(
+                self._comment_generator(video_id, since=since), 1):
+            comments += page
+            if progress:
+                progress(pages)
+            if len(comments) > number and number > 0:
+                return comments[:number]
+        return comments
+
+    def extract_comment(self, entry, video_id):
+        """
+        extract comment object from a json-converted gdata comment entry.
+
+        Parameters:
+        - entry: the comment entry of the gdata comments feed
+        - video_id: the youtube video id
+        Returns:
+        - a Comment object
+        """
+        return models.Comment(
+            id=entry["id"]["$t"],
+            video_id=video_id,
+            author_id=entry["author"][0]["yt$userId"]["$t"],
+            author_name=entry["author"][0]["name"]["$t"],
+            content=entry["content"]["$t"],
+            published=dateutil.parser.parse(entry["published"]["$t"]))
 
     def fetch_videoinfo(self, video_id):
         """
@@ -107,9 +298,18 @@ class YouTubeScraper:
 
         Returns:
         - tuple of Video object and list of Category objects
+
+        Raises:
+        - ValueError : if the video id is invalid
+        - RuntimeError : if gdata could not be reached, or the comments of
+                         the video are disallowed
         """
-        req = requests.get(self.video_url.format(video_id),
-                           params={"v": 2, "alt": "json"})
+        try:
+            req = self.session.get(self.video_url.format(video_id),
+                                   params={"v": 2, "alt": "json"})
+        except requests.exceptions.RequestException as err:
+            self.logger.exception("fetch_videoinfo: request failed")
+            raise RuntimeError(UNREACHABLE) from err
         if not req:
             self.logger.error("fetch_videoinfo: invalid video id")
             raise ValueError("invalid video id")
@@ -14,7 +14,8 @@ setup(
     packages=["sentimentube", "test"],
     scripts=["sentimentube/webserve.py"],
     long_description=open('README.md').read(),
-    install_requires=["requests", "flask", "matplotlib", "sqlalchemy", "nltk"],
+    install_requires=["requests", "flask", "matplotlib", "sqlalchemy", "nltk",
+                      "numpy", "scipy"],
     tests_require=["tox", "nose", "nose-pathmunge", "flake8", "pylint"],
     classifiers=[
         "Programming Language :: Python :: 2.7",
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Tests for the module batch. """
+from unittest import mock, TestCase
+import datetime
+import os
+import tempfile
+import sqlalchemy
+import batch
+import database
+import models
+
+
+def fake_scraper():
+    """ Return a mock YouTubeScraper with two comments per video. """
+    now = datetime.datetime.now()
+
+    def fetch_videoinfo(video_id):
+        """ Return new video info, the video "nocomments" has none. """
+        return (models.Video(id=video_id, title="title", author_id="author",
+                             viewcount=1, duration=5, likes=1, published=now,
+                             dislikes=1, rating=4.5, num_of_raters=1,
+                             timestamp=now, num_of_comments=2),
+                [models.VideoCategory(video_id=video_id, type="Music")])
+
+    def fetch_comments(video_id, since=None):
+        """ Return the comments of a video newer than since. """
+        if video_id == "nocomments":
+            raise RuntimeError("no comments for video")
+        comments = [models.Comment(id="{} {}".format(video_id, i),
+                                   video_id=video_id, author_id="author",
+                                   author_name="name", content="content",
+                                   published=now) for i in range(2)]
+        return [] if since else comments
+
+    scraper = mock.Mock()
+    scraper.fetch_videoinfo.side_effect = fetch_videoinfo
+    scraper.fetch_comments.side_effect = fetch_comments
+    return scraper
+
+
+def fake_analyzer():
+    """ Return a mock SentimentAnalysis finding every comment positive. """
+    analyzer = mock.Mock()
+    analyzer.classify_comment_sentiments.side_effect = lambda comments: [
+        models.CommentSentiment(id=comment.id, video_id=comment.video_id,
+                                positive=True) for comment in comments]
+    analyzer.video_sentiment.side_effect = \
+        lambda video_id, n_pos, n_neg: models.VideoSentiment(
+            id=video_id, n_pos=n_pos, n_neg=n_neg, result="positive")
+    return analyzer
+
+
+class BatchTestCase(TestCase):
+
+    """ This class has test-methods for the batch module. """
+
+    def setUp(self):
+        """
+        Point the database module at a database file in a temp dir.
+
+        the scrape thread has its own connection, so the database can not
+        be in memory
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine, self.session = database.ENGINE, database.DB_SESSION
+        database.ENGINE = sqlalchemy.create_engine("sqlite:///{}".format(
+            os.path.join(self.directory.name, "project.db")))
+        database.DB_SESSION = sqlalchemy.orm.scoped_session(
+            sqlalchemy.orm.sessionmaker(autocommit=False, autoflush=False,
+                                        bind=database.ENGINE))
+        database.init_db()
+
+    def tearDown(self):
+        """ Restore the database module and remove the temp dir. """
+        database.DB_SESSION.remove()
+        database.ENGINE.dispose()
+        database.ENGINE, database.DB_SESSION = self.engine, self.session
+        self.directory.cleanup()
+
+    def test_read_video_ids(self):
+        """ Test reading ids and urls, skipping comments and repeats. """
+        lines = ["tkXr3uxM2fY\n", "\n", "# a comment\n",
+                 "https://www.youtube.com/watch?v=5nO7IA1DeeI\n",
+                 "https://www.youtube.com/watch?list=PL1\n",
+                 "tkXr3uxM2fY\n"]
+        assert batch.read_video_ids(lines) == ["tkXr3uxM2fY", "5nO7IA1DeeI"]
+
+    def test_run_batch_stores_results(self):
+        """
+        Test that every video is analysed and failed ones are skipped.
+
+        running the batch again only scrapes, as no comments are new
+        """
+        video_ids = ["v1", "nocomments", "v2", "v3"]
+        analyzer = fake_analyzer()
+        stages, failed = batch.run_batch(video_ids, fake_scraper(),
+                                         analyzer, queue_size=1)
+        assert list(failed) == ["nocomments"]
+        assert [(stage.name, stage.videos, stage.comments)
+                for stage in stages] == [("scrape", 3, 6),
+                                         ("persist", 3, 6),
+                                         ("classify", 3, 6)]
+        assert database.DB_SESSION.query(models.CommentSentiment).count() \
+            == 6
+        assert {sentiment.id for sentiment in database.DB_SESSION.query(
+            models.VideoSentiment)} == {"v1", "v2", "v3"}
+        assert "videos/s" in str(stages[0])
+
+        stages, failed = batch.run_batch(video_ids, fake_scraper(), analyzer)
+        assert [stage.comments for stage in stages] == [0, 0, 0]
+        assert database.DB_SESSION.query(models.Comment).count() == 6
+
+    def test_run_batch_skips_database_errors(self):
+        """ Test that a database error only fails its video. """
+        store_comments = batch.analysis.store_comments
+
+        def failing_store(video_id, *args):
+            """ Fail storing the video "broken". """
+            if video_id == "broken":
+                raise sqlalchemy.exc.OperationalError(
+                    "INSERT", {}, Exception("database is locked"))
+            store_comments(video_id, *args)
+
+        with mock.patch("analysis.store_comments",
+                        side_effect=failing_store):
+            stages, failed = batch.run_batch(
+                ["v1", "broken", "v2"], fake_scraper(), fake_analyzer())
+        assert list(failed) == ["broken"]
+        assert stages[2].videos == 2
+        assert {sentiment.id for sentiment in database.DB_SESSION.query(
+            models.VideoSentiment)} == {"v1", "v2"}
+
+    def test_run_batch_skips_unexpected_errors(self):
+        """
+        Test that any error only fails its video.
+
+        a malformed gdata response raises a KeyError while scraping, which
+        must not end the batch
+        """
+        scraper = fake_scraper()
+        fetch_videoinfo = scraper.fetch_videoinfo.side_effect
+
+        def malformed(video_id):
+            """ Fail parsing the video "malformed". """
+            if video_id == "malformed":
+                raise KeyError("entry")
+            return fetch_videoinfo(video_id)
+
+        scraper.fetch_videoinfo.side_effect = malformed
+        analyzer = fake_analyzer()
+        classify = analyzer.classify_comment_sentiments.side_effect
+
+        def failing_classify(comments):
+            """ Fail classifying the video "broken". """
+            if comments and comments[0].video_id == "broken":
+                raise IndexError("list index out of range")
+            return classify(comments)
+
+        analyzer.classify_comment_sentiments.side_effect = failing_classify
+        stages, failed = batch.run_batch(
+            ["v1", "malformed", "broken", "v2"], scraper, analyzer)
+        assert {video_id: type(err) for video_id, err in failed.items()} == {
+            "malformed": KeyError, "broken": IndexError}
+        assert stages[2].videos == 2
+        assert {sentiment.id for sentiment in database.DB_SESSION.query(
+            models.VideoSentiment)} == {"v1", "v2"}
+
+    def test_run_batch_fails_videos_not_scraped(self):
+        """ Test that the videos after the scrape thread ended are failed. """
+        def scrape_first(video_ids, scraper, scraped, stage):
+            """ End after the first video like a scrape thread that died. """
+            scraped.put((video_ids[0], RuntimeError("no comments")))
+            scraped.put(None)
+
+        with mock.patch("batch._scrape", side_effect=scrape_first):
+            _, failed = batch.run_batch(["v1", "v2", "v3"], fake_scraper(),
+                                        fake_analyzer())
+        assert list(failed) == ["v1", "v2", "v3"]
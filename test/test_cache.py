@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Tests for the module cache. """
+from unittest import TestCase
+import cache
+
+
+class LRUCacheTestCase(TestCase):
+
+    """ This class has test-methods for the LRUCache class. """
+
+    def test_get_and_put(self):
+        """ Test that a value put in the cache is returned by get. """
+        lru = cache.LRUCache(max_size=100)
+        lru.put("a", b"1234")
+        assert lru.get("a") == b"1234"
+        assert lru.get("b") is None
+        assert lru.get("b", b"") == b""
+        assert (lru.hits, lru.misses) == (1, 2)
+        assert lru.size == 4
+
+    def test_evicts_least_recently_used(self):
+        """ Test that the least recently used values are evicted. """
+        lru = cache.LRUCache(max_size=10)
+        lru.put("a", b"1234")
+        lru.put("b", b"1234")
+        lru.get("a")
+        lru.put("c", b"1234")
+        assert "a" in lru and "c" in lru
+        assert "b" not in lru
+        assert lru.size == 8
+
+    def test_max_entries(self):
+        """ Test that no more than max_entries values are kept. """
+        lru = cache.LRUCache(max_size=100, max_entries=2)
+        for key in "abc":
+            lru.put(key, b"1")
+        assert len(lru) == 2
+        assert "a" not in lru
+
+    def test_replace_and_too_large(self):
+        """ Test replacing a value, and not adding one larger than all. """
+        lru = cache.LRUCache(max_size=10)
+        lru.put("a", b"1234")
+        lru.put("a", b"12")
+        assert lru.size == 2
+        lru.put("b", b"12345678901")
+        assert "b" not in lru
+        lru.put("a", (b"1234", "extra"), size=4)
+        assert lru.get("a") == (b"1234", "extra")
+        assert lru.size == 4
+        lru.remove("a")
+        lru.clear()
+        assert lru.size == 0 and not lru
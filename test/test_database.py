@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Tests for the module database. """
+from unittest import TestCase
+import os
+import tempfile
+import sqlalchemy
+import database
+import models
+
+
+class DatabaseTestCase(TestCase):
+
+    """ This class has test-methods for the database module. """
+
+    def setUp(self):
+        """ Point the database module at a database file in a temp dir. """
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = database.ENGINE
+        database.ENGINE = sqlalchemy.create_engine("sqlite:///{}".format(
+            os.path.join(self.directory.name, "project.db")))
+
+    def tearDown(self):
+        """ Restore the database engine and remove the temp dir. """
+        database.ENGINE.dispose()
+        database.ENGINE = self.engine
+        self.directory.cleanup()
+
+    def index_names(self):
+        """ Return the names of the indexes of the database. """
+        inspector = sqlalchemy.inspect(database.ENGINE)
+        return {index["name"] for table in inspector.get_table_names()
+                for index in inspector.get_indexes(table)}
+
+    def test_migrate_db_creates_missing_indexes(self):
+        """ Test that migrating a database without indexes creates them. """
+        database.init_db()
+        with database.ENGINE.begin() as connection:
+            for name in self.index_names():
+                connection.execute(sqlalchemy.text(
+                    "DROP INDEX {}".format(name)))
+        assert not self.index_names()
+
+        database.migrate_db()
+        assert self.index_names() == {
+            index.name for table in database.BASE.metadata.sorted_tables
+            for index in table.indexes}
+        assert "ix_videos_timestamp" in self.index_names()
+        # migrating an up to date database does nothing
+        database.migrate_db()
+
+    def test_connections_use_wal(self):
+        """ Test that new connections are tuned by set_pragmas. """
+        database.init_db()
+        with database.ENGINE.connect() as connection:
+            assert connection.execute(sqlalchemy.text(
+                "PRAGMA journal_mode")).scalar() == "wal"
+            assert connection.execute(sqlalchemy.text(
+                "PRAGMA synchronous")).scalar() == 1
+
+    def test_comment_sentiment_counts_use_index(self):
+        """ Test that counting comment sentiments searches the index. """
+        database.init_db()
+        query = sqlalchemy.select(
+            models.CommentSentiment.positive,
+            sqlalchemy.func.count()).where(
+                models.CommentSentiment.video_id == "dQw4w9WgXcQ").group_by(
+                    models.CommentSentiment.positive)
+        with database.ENGINE.connect() as connection:
+            plan = connection.exec_driver_sql(
+                "EXPLAIN QUERY PLAN {}".format(query.compile(
+                    compile_kwargs={"literal_binds": True}))).fetchall()
+        assert "COVERING INDEX ix_commentsentiments_video_id_positive" in \
+            plan[0][-1]
@@ -4,12 +4,18 @@
 
 """ Module for integration testing the webserve module. """
 
-from unittest import TestCase
+from unittest import mock, TestCase
+import flask
+import analysis
+import instrumentation
+import jobs
 import webserve
 import database
 import sqlalchemy
 import models
 import datetime
+import os
+import tempfile
 
 
 def insert_rows(video_ids=None, positive_list=None):
@@ -75,6 +81,10 @@ class WebServeTestCase(TestCase):
         sets flask up for testing
         """
         webserve.APP.config["TESTING"] = True
+        webserve.APP.config["BACKGROUND_JOBS"] = False
+        webserve.PLOT_CACHE.clear()
+        webserve.VIDEO_INFO_CACHE.clear()
+        webserve.PAGE_CACHE.clear()
         self.app = webserve.APP.test_client()
         database.ENGINE = sqlalchemy.create_engine("sqlite://", echo=False)
         database.DB_SESSION = \
@@ -185,7 +195,8 @@ class WebServeTestCase(TestCase):
                                              published=now,
                                              dislikes=1, rating=5,
                                              num_of_raters=1,
-                                             timestamp=now,
+                                             timestamp=now - datetime
+                                             .timedelta(days=1),
                                              num_of_comments=10))
         database.DB_SESSION.add(models.Comment(id="comment {}".format(v_id),
                                                video_id=v_id,
@@ -275,6 +286,20 @@ class WebServeTestCase(TestCase):
                                 .format(v_id))
         assert response.status_code == 200
 
+    @mock.patch("analysis.comment_sentiment_counts")
+    def test_comment_sentiment_plot_counts_in_database(self, counts):
+        """
+        Test that the comment sentiment plot is drawn from the two counts.
+
+        :param counts: Mock object for analysis.comment_sentiment_counts
+        """
+        counts.return_value = (30000, 20000)
+        response = self.app.get(
+            "/comment_sentiment_plot.png?video_id=tkXr3uxM2fY")
+        assert response.status_code == 200
+        assert response.mimetype == "image/png"
+        counts.assert_called_once_with("tkXr3uxM2fY")
+
     def test_video_page_video_sentiment_plot_correct(self):
         """
         Test that video sentiment on video page load works correctly.
@@ -287,6 +312,177 @@ class WebServeTestCase(TestCase):
                                 .format(v_id))
         assert response.status_code == 200
 
+    def test_comparison_sentiments_same_category(self):
+        """
+        Test that a video is compared with the videos of its categories.
+
+        only n_pos and n_neg are queried, and a video in two of the
+        categories is compared once
+        """
+        v_ids = ["tkXr3uxM2fY", "5nO7IA1DeeI", "vykkfDITkQs", "C3zqYM3Rkpg"]
+        insert_rows(v_ids)
+        for v_id, types in zip(v_ids, [["Music", "Comedy"], ["Music"],
+                                       ["Music", "Comedy"], ["Sports"]]):
+            database.DB_SESSION.add_all([models.VideoCategory(
+                video_id=v_id, type=category) for category in types])
+        database.DB_SESSION.commit()
+
+        categories, query = analysis.comparison_sentiments(v_ids[0])
+        assert categories == ["Comedy", "Music"]
+        assert query.all() == [(5.2, 10.2), (5.2, 10.2)]
+        assert analysis.sentiment_summary(query) == \
+            (2, 5.2, 5.2, 10.2, 10.2, 10.4, 20.4)
+        # without categories it is compared with every other video
+        _, query = analysis.comparison_sentiments("eYhHyUU-CYU")
+        assert query.count() == 4
+
+    def test_sentiment_density_bins_in_database(self):
+        """ Test that the sentiments are counted in a grid of bins. """
+        v_ids = ["v{}".format(i) for i in range(5)]
+        insert_rows(v_ids)
+        for v_id, n_pos in zip(v_ids, [0, 0.1, 0.45, 0.5, 1]):
+            database.DB_SESSION.merge(models.VideoSentiment(
+                id=v_id, n_pos=n_pos, n_neg=1 - n_pos, result="neutral"))
+        database.DB_SESSION.commit()
+
+        _, query = analysis.comparison_sentiments("tkXr3uxM2fY")
+        density = analysis.sentiment_density(query, (0, 1, 0, 1), 2)
+        assert density == {(0, 1): 3, (1, 0): 1, (1, 1): 1}
+
+    def test_video_sentiment_plot_density(self):
+        """ Test the video sentiment plot drawing the density. """
+        v_ids = ["v{}".format(i) for i in range(10)]
+        insert_rows(v_ids)
+        webserve.APP.config["SCATTER_LIMIT"] = 5
+        webserve.DENSITY_CACHE.clear()
+        try:
+            with mock.patch("analysis.sentiment_summary",
+                            wraps=analysis.sentiment_summary) as summary:
+                response = self.app.get(
+                    "/video_sentiment_plot.png?video_id=v0")
+                other = self.app.get("/video_sentiment_plot.png?video_id=v1")
+            _, extent, grid = webserve._category_density(  # noqa # pylint: disable=W0212
+                [], webserve.APP.config["DENSITY_BINS"])
+        finally:
+            webserve.APP.config["SCATTER_LIMIT"] = 2000
+        assert response.status_code == 200
+        assert response.mimetype == "image/png"
+        assert other.status_code == 200
+        # the videos of a category share the summary and the grid
+        assert len(webserve.DENSITY_CACHE) == 1
+        summary.assert_called_once()
+        # every video has the same sentiment, the grid is drawn around it
+        assert extent == (4.7, 5.7, 9.7, 10.7)
+        assert grid.sum() == 10
+
+        # a saved sentiment counts them again
+        analysis.save_sentiment(models.VideoSentiment(
+            id="v0", n_pos=0.5, n_neg=0.5, result="neutral"), [])
+        assert len(webserve.DENSITY_CACHE) == 0
+
+    def test_plot_cached_and_revalidated(self):
+        """
+        Test that a plot is rendered once and revalidated by its ETag.
+
+        the plot is rendered again when its data changes
+        """
+        v_id = "tkXr3uxM2fY"
+        insert_rows([v_id], [True, False])
+        url = "/comment_sentiment_plot.png?video_id={}".format(v_id)
+        with mock.patch("webserve._render_png",
+                        side_effect=webserve._render_png) as render:  # noqa
+            first = self.app.get(url)
+            second = self.app.get(url)
+            assert render.call_count == 1
+            assert first.data == second.data
+            assert first.headers["ETag"] == second.headers["ETag"]
+            assert first.last_modified
+
+            response = self.app.get(url, headers={
+                "If-None-Match": first.headers["ETag"]})
+            assert response.status_code == 304
+            assert not response.data
+
+            database.DB_SESSION.add(models.CommentSentiment(
+                id="comment 0 2", video_id=v_id, positive=True))
+            database.DB_SESSION.commit()
+            response = self.app.get(url, headers={
+                "If-None-Match": first.headers["ETag"]})
+            assert response.status_code == 200
+            assert response.headers["ETag"] != first.headers["ETag"]
+            assert render.call_count == 2
+
+    def test_video_page_url_without_video_id(self):
+        """ Test that a youtube url without a video id shows an error. """
+        response = self.app.get("/video", query_string={
+            "video_id": "https://www.youtube.com/watch?list=PL1"})
+        assert response.status_code == 200
+        assert "invalid video id" in response.data.decode("utf-8")
+
+    def test_database_set_up_before_first_request(self):
+        """ Test that the first request creates and migrates the database. """
+        database.ENGINE = sqlalchemy.create_engine("sqlite://", echo=False)
+        database.DB_SESSION = sqlalchemy.orm.scoped_session(
+            sqlalchemy.orm.sessionmaker(bind=database.ENGINE))
+        webserve._DATABASE_READY.clear()  # pylint: disable=W0212
+        response = self.app.get("/previous")
+        assert response.status_code == 200
+        indexes = {index["name"] for index in sqlalchemy.inspect(
+            database.ENGINE).get_indexes("videos")}
+        assert "ix_videos_timestamp" in indexes
+
+    def test_instrumentation(self):
+        """
+        Test the Server-Timing header and the metrics of the requests.
+
+        without instrumentation there is no header
+        """
+        v_id = "tkXr3uxM2fY"
+        insert_rows([v_id])
+        url = "/comment_sentiment_plot.png?video_id={}".format(v_id)
+        assert "Server-Timing" not in self.app.get(url).headers
+
+        webserve.PLOT_CACHE.clear()
+        instrumentation.REGISTRY.clear()
+        webserve.APP.config["INSTRUMENTATION"] = True
+        try:
+            response = self.app.get(url)
+            metrics = self.app.get("/metrics")
+        finally:
+            webserve.APP.config["INSTRUMENTATION"] = False
+        timing = response.headers["Server-Timing"]
+        assert timing.startswith("render_plot;dur=")
+        assert "total;dur=" in timing
+        assert metrics.mimetype == "text/plain"
+        text = metrics.data.decode("utf-8")
+        assert 'sentimentube_span_seconds_count{span="render_plot"} 1' \
+            in text
+        assert 'sentimentube_request_seconds_count{' \
+            'endpoint="comment_sentiment_plot"} 1' in text
+
+    def test_video_page_profiled(self):
+        """ Test that a video page asking for it is profiled. """
+        v_id = "tkXr3uxM2fY"
+        insert_rows([v_id])
+        with tempfile.TemporaryDirectory() as directory:
+            webserve.APP.config["PROFILE_DIR"] = directory
+            webserve.APP.config["PROFILE_TOKEN"] = "s3cret"
+            try:
+                response = self.app.get(
+                    "/video?video_id={}".format(v_id),
+                    headers={"X-Profile": "s3cret"})
+                anonymous = self.app.get(
+                    "/video?video_id={}&profile=1".format(v_id))
+                unprofiled = self.app.get("/video?video_id={}".format(v_id))
+            finally:
+                webserve.APP.config["PROFILE_DIR"] = None
+                webserve.APP.config["PROFILE_TOKEN"] = None
+            assert "Analysis of video with ID: {}".format(v_id) in \
+                response.data.decode("utf-8")
+            assert os.listdir(directory) == [response.headers["X-Profile"]]
+            assert "X-Profile" not in unprofiled.headers
+            assert "X-Profile" not in anonymous.headers
+
     def test_previous_page_taking_newest(self):
         """
         Test that the previous page shows the 5 most recent analyses.
@@ -348,3 +544,264 @@ class WebServeTestCase(TestCase):
         response = self.app.get("/video?video_id={}".format("wv4ol_Q4G_k"))
         assert "Error: no comments for video" in \
                response.data.decode("utf-8")
+
+    @mock.patch("webserve.SCRAPER")
+    def test_video_page_classifies_only_new_comments(self, scraper):
+        """
+        Test that only comments without a stored sentiment are classified.
+
+        the video sentiment is made from the stored counts plus the new ones
+        :param scraper: Mock object for the YouTubeScraper
+        """
+        v_id = "tkXr3uxM2fY"
+        insert_rows([v_id], positive_list=[True, True])
+        now = datetime.datetime.now()
+        # analysed a day ago, so the video info is fetched again
+        database.DB_SESSION.query(models.Video).filter_by(id=v_id).update(
+            {"timestamp": now - datetime.timedelta(days=1)})
+        video_info = models.Video(id=v_id, title="test title",
+                                  author_id="test author id", viewcount=1,
+                                  duration=5, likes=1, published=now,
+                                  dislikes=1, rating=4.5, num_of_raters=1,
+                                  timestamp=now, num_of_comments=3)
+        stored = database.DB_SESSION.query(models.Comment).filter_by(
+            video_id=v_id).all()
+        new_comment = models.Comment(id="new comment", video_id=v_id,
+                                     author_id="test author id",
+                                     author_name="test author",
+                                     content="I hate you", published=now)
+        scraper.fetch_videoinfo.return_value = (video_info, [])
+        scraper.fetch_comments.return_value = stored + [new_comment]
+
+        with mock.patch.object(
+                webserve.ANALYZER, "classify_comment_sentiments",
+                return_value=[models.CommentSentiment(
+                    id="new comment", video_id=v_id, positive=0)]) as clf:
+            self.app.get("/video?video_id={}".format(v_id))
+            clf.assert_called_once()
+            assert [comment.id for comment in clf.call_args[0][0]] == \
+                ["new comment"]
+        since = scraper.fetch_comments.call_args[1]["since"]
+        assert since.id in [comment.id for comment in stored]
+
+        sentiment = database.DB_SESSION.query(
+            models.VideoSentiment).filter_by(id=v_id).first()
+        assert sentiment.n_pos == 2 / 3
+        assert sentiment.n_neg == 1 / 3
+        assert analysis.comment_sentiment_counts(v_id) == (2, 1)
+
+    @mock.patch("webserve.SCRAPER")
+    def test_video_page_fresh_video_served_locally(self, scraper):
+        """
+        Test that a recently analysed video is shown without fetching.
+
+        after the staleness window the video info is fetched again
+        :param scraper: Mock object for the YouTubeScraper
+        """
+        v_id = "tkXr3uxM2fY"
+        insert_rows([v_id])
+        response = self.app.get("/video?video_id={}".format(v_id))
+        assert "Analysis of video with ID: {}".format(v_id) in \
+            response.data.decode("utf-8")
+        scraper.fetch_videoinfo.assert_not_called()
+
+        webserve.VIDEO_INFO_CACHE.clear()
+        database.DB_SESSION.query(models.Video).filter_by(id=v_id).update(
+            {"timestamp": datetime.datetime.now() -
+             datetime.timedelta(seconds=webserve.APP.config[
+                 "VIDEO_INFO_TTL"] + 1)})
+        database.DB_SESSION.commit()
+        stored = database.DB_SESSION.query(models.Video).filter_by(
+            id=v_id).first()
+        scraper.fetch_videoinfo.return_value = (models.Video(
+            **{column.name: getattr(stored, column.name)
+               for column in models.Video.__table__.columns}), [])
+        response = self.app.get("/video?video_id={}".format(v_id))
+        assert "Analysis of video with ID: {}".format(v_id) in \
+            response.data.decode("utf-8")
+        scraper.fetch_videoinfo.assert_called_once_with(v_id)
+
+    def test_video_page_response_cached(self):
+        """
+        Test that the page of an analysed video is rendered once.
+
+        saving a new sentiment for the video invalidates the page
+        """
+        v_id = "tkXr3uxM2fY"
+        insert_rows([v_id], positive_list=[True, False, True])
+        url = "/video?video_id={}".format(v_id)
+        with mock.patch("flask.render_template",
+                        side_effect=flask.render_template) as render:
+            first = self.app.get(url).data.decode("utf-8")
+            assert self.app.get(url).data.decode("utf-8") == first
+            assert render.call_count == 1
+            assert render.call_args[1]["video"]["num_of_comments"] == 3
+
+            analysis.save_sentiment(models.VideoSentiment(
+                id=v_id, n_pos=0.5, n_neg=0.5, result="neutral"), [])
+            assert v_id not in webserve.PAGE_CACHE
+            self.app.get(url)
+            assert render.call_count == 2
+
+    @mock.patch("webserve.SCRAPER")
+    def test_video_page_cache_follows_video_info(self, scraper):
+        """
+        Test that the cached page shows the info fetched after the TTL.
+
+        the number of comments is the same, so the stored video is not
+        updated
+        :param scraper: Mock object for the YouTubeScraper
+        """
+        v_id = "tkXr3uxM2fY"
+        insert_rows([v_id], positive_list=[True, False])
+        stored = database.DB_SESSION.query(models.Video).filter_by(
+            id=v_id).first()
+        stored.timestamp -= datetime.timedelta(days=1)
+        database.DB_SESSION.commit()
+        columns = {column.name: getattr(stored, column.name)
+                   for column in models.Video.__table__.columns}
+        url = "/video?video_id={}".format(v_id)
+
+        scraper.fetch_videoinfo.return_value = (models.Video(**columns), [])
+        assert "Viewcount: 1\n" in self.app.get(url).data.decode("utf-8")
+        assert "Viewcount: 1\n" in self.app.get(url).data.decode("utf-8")
+
+        webserve.VIDEO_INFO_CACHE.clear()
+        columns["viewcount"] = 1000
+        scraper.fetch_videoinfo.return_value = (models.Video(**columns), [])
+        assert "Viewcount: 1000\n" in \
+            self.app.get(url).data.decode("utf-8")
+        assert scraper.fetch_videoinfo.call_count == 2
+
+    @mock.patch("webserve.JOBS")
+    @mock.patch("webserve.SCRAPER")
+    def test_video_page_caches_fetched_video_info(self, scraper,
+                                                  job_manager):
+        """
+        Test that the info of a video is fetched once per staleness window.
+
+        :param scraper: Mock object for the YouTubeScraper
+        :param job_manager: Mock object for the JobManager
+        """
+        v_id = "tkXr3uxM2fY"
+        webserve.APP.config["BACKGROUND_JOBS"] = True
+        scraper.fetch_videoinfo.return_value = (models.Video(
+            id=v_id, num_of_comments=5), [models.VideoCategory(
+                video_id=v_id, type="Music")])
+        job_manager.submit.return_value = {"video_id": v_id,
+                                           "state": "queued"}
+        for _ in range(3):
+            self.app.get("/video?video_id={}".format(v_id))
+        scraper.fetch_videoinfo.assert_called_once_with(v_id)
+        assert job_manager.submit.call_count == 3
+
+        video_info, categories = webserve._videoinfo(v_id, None)  # noqa
+        assert video_info.num_of_comments == 5
+        assert [category.type for category in categories] == ["Music"]
+        # the objects are new each time
+        assert video_info is not scraper.fetch_videoinfo.return_value[0]
+
+    @mock.patch("webserve.JOBS")
+    @mock.patch("webserve.SCRAPER")
+    def test_video_page_queues_background_job(self, scraper, job_manager):
+        """
+        Test that a new video is analysed in a background job.
+
+        the video page shows the job status, which is also served by /status
+        :param scraper: Mock object for the YouTubeScraper
+        :param job_manager: Mock object for the JobManager
+        """
+        v_id = "tkXr3uxM2fY"
+        webserve.APP.config["BACKGROUND_JOBS"] = True
+        scraper.fetch_videoinfo.return_value = (models.Video(id=v_id), [])
+        status = {"video_id": v_id, "state": "running", "pages_fetched": 3,
+                  "comments_classified": 0, "error": None}
+        job_manager.submit.return_value = status
+        job_manager.status.return_value = status
+
+        response = self.app.get("/video?video_id={}".format(v_id))
+        job_manager.submit.assert_called_once_with(
+            v_id, webserve._plain_info(  # noqa # pylint: disable=W0212
+                models.Video(id=v_id), []))
+        assert "Analysing video with ID: {}".format(v_id) in \
+            response.data.decode("utf-8")
+        scraper.fetch_comments.assert_not_called()
+
+        response = self.app.get("/status?video_id={}".format(v_id))
+        assert response.get_json() == status
+
+        job_manager.status.return_value = None
+        response = self.app.get("/status?video_id=unknown")
+        assert response.status_code == 404
+
+    @mock.patch("webserve.JOBS")
+    @mock.patch("webserve.SCRAPER")
+    def test_job_stores_video_info_of_page(self, scraper, job_manager):
+        """
+        Test that the job stores the video info the page compares with.
+
+        the job fetching the info itself would store another number of
+        comments, and every reload of the page would queue another job
+        :param scraper: Mock object for the YouTubeScraper of the page
+        :param job_manager: Mock object for the JobManager
+        """
+        v_id = "tkXr3uxM2fY"
+        webserve.APP.config["BACKGROUND_JOBS"] = True
+        now = datetime.datetime.now()
+        columns = {"id": v_id, "title": "title", "author_id": "author",
+                   "viewcount": 1, "duration": 10, "rating": 3.5,
+                   "published": now, "timestamp": now}
+        scraper.fetch_videoinfo.return_value = (models.Video(
+            num_of_comments=5, **columns), [])
+        job_manager.submit.return_value = {"video_id": v_id,
+                                           "state": "queued"}
+        self.app.get("/video?video_id={}".format(v_id))
+        assert job_manager.submit.call_count == 1
+
+        job_scraper = mock.Mock()
+        job_scraper.fetch_videoinfo.return_value = (models.Video(
+            num_of_comments=7, **columns), [])
+        job_scraper.fetch_comments.return_value = [models.Comment(
+            id="c1", video_id=v_id, author_id="a", author_name="a",
+            content="I love you", published=datetime.datetime.now())]
+        statuses = {v_id: {"video_id": v_id, "state": "queued"}}
+        with mock.patch.dict("jobs._WORKER", scraper=job_scraper,
+                             analyzer=webserve.ANALYZER):
+            jobs.run_job(v_id, statuses,
+                         *job_manager.submit.call_args[0][1:])
+        assert statuses[v_id]["state"] == "done"
+        job_scraper.fetch_videoinfo.assert_not_called()
+
+        response = self.app.get("/video?video_id={}".format(v_id))
+        assert "Analysis of video with ID: {}".format(v_id) in \
+            response.data.decode("utf-8")
+        assert job_manager.submit.call_count == 1
+
+    @mock.patch("webserve.JOBS")
+    @mock.patch("webserve.SCRAPER")
+    def test_video_stored_without_sentiment(self, scraper, job_manager):
+        """
+        Test a video that is stored but has no sentiment yet.
+
+        the video is stored before its sentiment, so while its job runs or
+        after it has failed, the page queues a job instead of showing the
+        missing sentiment
+        :param scraper: Mock object for the YouTubeScraper of the page
+        :param job_manager: Mock object for the JobManager
+        """
+        v_id = "tkXr3uxM2fY"
+        webserve.APP.config["BACKGROUND_JOBS"] = True
+        now = datetime.datetime.now()
+        columns = {"id": v_id, "title": "title", "author_id": "author",
+                   "viewcount": 1, "duration": 10, "rating": 3.5,
+                   "published": now, "timestamp": now, "num_of_comments": 5}
+        database.DB_SESSION.add(models.Video(**columns))
+        database.DB_SESSION.commit()
+        scraper.fetch_videoinfo.return_value = (models.Video(**columns), [])
+        job_manager.submit.return_value = {"video_id": v_id,
+                                           "state": "running"}
+
+        response = self.app.get("/video?video_id={}".format(v_id))
+        assert response.status_code == 200
+        assert job_manager.submit.call_count == 1
+        assert v_id not in webserve.PAGE_CACHE
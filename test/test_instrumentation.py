@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0212
+
+""" Tests for the module instrumentation. """
+from unittest import TestCase
+import instrumentation
+
+
+class InstrumentationTestCase(TestCase):
+
+    """ This class has test-methods for the instrumentation module. """
+
+    def tearDown(self):
+        """ Stop recording a request left by a test. """
+        instrumentation.finish_request("test", instrumentation.Registry())
+
+    def test_span_without_request_is_noop(self):
+        """ Test that spans outside a recorded request measure nothing. """
+        assert instrumentation.span("classify") is instrumentation._NULL_SPAN
+        with instrumentation.span("classify"):
+            pass
+        assert instrumentation.finish_request("test") is None
+
+    def test_request_spans_counted(self):
+        """ Test that the spans of a request are returned and counted. """
+        registry = instrumentation.Registry()
+        instrumentation.start_request()
+        for _ in range(2):
+            with instrumentation.span("classify"):
+                pass
+        with instrumentation.span("render_template"):
+            pass
+        seconds, spans = instrumentation.finish_request("video", registry)
+        assert [name for name, _ in spans] == \
+            ["classify", "classify", "render_template"]
+        assert seconds >= sum(span_seconds for _, span_seconds in spans)
+
+        header = instrumentation.server_timing(seconds, spans)
+        assert [part.split(";")[0] for part in header.split(", ")] == \
+            ["classify", "render_template", "total"]
+
+        text = registry.render()
+        assert "# TYPE sentimentube_span_seconds histogram" in text
+        assert 'sentimentube_span_seconds_count{span="classify"} 2' in text
+        assert 'sentimentube_span_seconds_bucket{span="classify",' \
+            'le="+Inf"} 2' in text
+        assert 'sentimentube_request_seconds_count{endpoint="video"} 1' \
+            in text
+
+    def test_histogram_buckets(self):
+        """ Test that durations are counted in cumulative buckets. """
+        histogram = instrumentation.Histogram(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(seconds)
+        assert histogram.cumulative() == [(0.1, 2), (1.0, 3),
+                                          (float("inf"), 4)]
+        assert histogram.count == 4
+        assert histogram.sum == 2.65
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# pylint: disable=R0201
+
+""" Tests for the module jobs. """
+from unittest import mock, TestCase
+import time
+import jobs
+
+
+def slow_job(video_id, statuses, _info):
+    """ Job target taking a while, reporting a page fetched. """
+    jobs._update(statuses, video_id, state="running")  # noqa
+    time.sleep(0.5)
+    jobs._update(statuses, video_id, state="done", pages_fetched=1)  # noqa
+
+
+def quick_job(video_id, statuses, _info):
+    """ Job target finishing right away. """
+    jobs._update(statuses, video_id, state="done")  # noqa
+
+
+def wait_finished(manager):
+    """ Wait until the jobs of a JobManager are moved to its finished. """
+    for _ in range(100):
+        with manager._lock:  # pylint: disable=W0212
+            if not manager._futures:  # pylint: disable=W0212
+                return
+        time.sleep(0.1)
+    raise AssertionError("jobs not finished")
+
+
+class JobManagerTestCase(TestCase):
+
+    """ This class has test-methods for the JobManager class. """
+
+    @mock.patch("jobs._init_worker")
+    def test_submit_coalesces_jobs(self, init_worker):
+        """
+        Test that submitting a queued video again gives the same job.
+
+        :param init_worker: Mock object for the worker set up
+        """
+        init_worker.return_value = None
+        manager = jobs.JobManager(processes=1, target=slow_job)
+        try:
+            first = manager.submit("dQw4w9WgXcQ")
+            second = manager.submit("dQw4w9WgXcQ")
+            assert first["state"] in ("queued", "running")
+            assert second["state"] in ("queued", "running")
+            assert len(manager._futures) == 1  # pylint: disable=W0212
+            manager._futures["dQw4w9WgXcQ"].result(timeout=10)  # noqa
+            wait_finished(manager)
+            status = manager.status("dQw4w9WgXcQ")
+            assert status["state"] == "done"
+            assert status["pages_fetched"] == 1
+            assert manager.status("unknown") is None
+        finally:
+            manager.shutdown()
+
+    @mock.patch("jobs._init_worker")
+    def test_finished_jobs_are_bounded(self, init_worker):
+        """
+        Test that only the statuses of the last finished jobs are kept.
+
+        :param init_worker: Mock object for the worker set up
+        """
+        init_worker.return_value = None
+        manager = jobs.JobManager(processes=2, target=quick_job, finished=2)
+        try:
+            for video_id in ("first", "second", "third"):
+                manager.submit(video_id)
+            wait_finished(manager)
+            assert manager._futures == {}  # pylint: disable=W0212
+            assert len(manager._statuses) == 0  # pylint: disable=W0212
+            assert manager.status("first") is None
+            assert manager.status("second")["state"] == "done"
+            assert manager.status("third")["state"] == "done"
+        finally:
+            manager.shutdown()
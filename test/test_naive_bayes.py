@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# pylint: disable=R0201
+
+""" Tests for the module naive_bayes. """
+from unittest import TestCase, mock
+import os
+import tempfile
+import nltk
+import numpy
+import naive_bayes
+
+TAGGED_TEXT = [(["love", "sweet", "you"], "positive"),
+               (["happy", "love", "you"], "positive"),
+               (["hate", "mad", "you"], "negative")]
+
+
+def full_features(words):
+    """ Return the featureset of every word of TAGGED_TEXT. """
+    return {naive_bayes.feature_name(word): word in words
+            for text, _ in TAGGED_TEXT for word in text}
+
+
+class NaiveBayesScorerTestCase(TestCase):
+
+    """ This class has test-methods for naive_bayes module. """
+
+    def setUp(self):
+        """ Set up a scorer with two labels and three words. """
+        present = numpy.log2([[0.9, 0.1], [0.1, 0.9], [0.5, 0.5]])
+        absent = numpy.log2([[0.1, 0.9], [0.9, 0.1], [0.5, 0.5]])
+        self.scorer = naive_bayes.NaiveBayesScorer(
+            ["positive", "negative"], ["love", "hate", "you"],
+            numpy.log2([0.5, 0.5]), numpy.hstack([present, absent]))
+
+    def test_features_ignores_unknown_and_repeated_words(self):
+        """ Test the document-word matrix of features. """
+        matrix = self.scorer.features([["you", "you", "love"], ["what"]])
+        assert matrix.shape == (2, 3)
+        assert matrix.toarray().tolist() == [[1, 0, 1], [0, 0, 0]]
+
+    def test_classify_many(self):
+        """ Test the labels of classify_many. """
+        assert self.scorer.classify_many(
+            [["love", "you"], ["hate"], ["love", "hate"]]) == \
+            ["positive", "negative", "positive"]
+        assert self.scorer.classify_many([]) == []
+
+    def test_save_and_load(self):
+        """ Test that a saved model file loads as the same model. """
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "classifier.model")
+            self.scorer.save(file_path)
+            loaded = naive_bayes.NaiveBayesScorer.load(file_path)
+            assert loaded.labels == self.scorer.labels
+            assert loaded.vocabulary == self.scorer.vocabulary
+            assert loaded.likelihoods.dtype == numpy.float32
+            assert not loaded.likelihoods.flags.writeable
+            assert numpy.allclose(loaded.present, self.scorer.present)
+            assert numpy.allclose(loaded.absent, self.scorer.absent)
+            assert numpy.allclose(loaded.log_priors, self.scorer.log_priors)
+            del loaded
+
+    def test_save_replaces_mapped_file(self):
+        """ Test that saving over a loaded model leaves the loaded one. """
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "classifier.model")
+            self.scorer.save(file_path)
+            loaded = naive_bayes.NaiveBayesScorer.load(file_path)
+            inode = os.stat(file_path).st_ino
+            other = naive_bayes.NaiveBayesScorer(
+                ["positive", "negative"], ["sweet"], numpy.log2([0.5, 0.5]),
+                numpy.log2([[0.9, 0.1, 0.1, 0.9]]))
+            other.save(file_path)
+            # rewriting the mapped file in place would crash this process
+            assert os.stat(file_path).st_ino != inode
+            assert os.listdir(directory) == ["classifier.model"]
+            assert loaded.vocabulary == ["love", "hate", "you"]
+            assert numpy.allclose(loaded.present, self.scorer.present)
+            assert naive_bayes.NaiveBayesScorer.load(
+                file_path).vocabulary == ["sweet"]
+            del loaded
+
+    def test_load_wrong_file(self):
+        """ Test that loading a file of another format fails. """
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "classifier.pickle")
+            with open(file_path, "wb") as write_file:
+                write_file.write(b"not a model file")
+            self.assertRaises(ValueError, naive_bayes.NaiveBayesScorer.load,
+                              file_path)
+
+    def test_main_trains_model_file(self):
+        """ Test that the script trains a model file from the corpus. """
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_path = os.path.join(directory, "corpus.txt")
+            with open(corpus_path, "w") as corpus_file:
+                corpus_file.write("Sentiment, SentimentText\n"
+                                  "1;I love you\n"
+                                  "0;I hate you\n")
+            file_path = os.path.join(directory, "classifier.model")
+            with mock.patch("sys.argv", ["naive_bayes.py", file_path,
+                                         "--corpus", corpus_path]):
+                naive_bayes.main()
+            scorer = naive_bayes.NaiveBayesScorer.load(file_path)
+            assert set(scorer.labels) == {"positive", "negative"}
+            assert "love" in scorer.vocabulary
+
+
+class NaiveBayesCountsTestCase(TestCase):
+
+    """ This class has test-methods for the NaiveBayesCounts class. """
+
+    def setUp(self):
+        """ Count TAGGED_TEXT and train the nltk classifier on it. """
+        self.counts = naive_bayes.NaiveBayesCounts()
+        for words, label in TAGGED_TEXT:
+            self.counts.add(words, label)
+        self.expected = nltk.NaiveBayesClassifier.train(
+            [(full_features(words), label) for words, label in TAGGED_TEXT])
+
+    def test_to_classifier(self):
+        """ Test that the counted classifier equals the trained one. """
+        # pylint: disable=protected-access
+        classifier = self.counts.to_classifier()
+        assert classifier.labels() == self.expected.labels()
+        assert set(classifier._feature_probdist) == \
+            set(self.expected._feature_probdist)
+        for key, probdist in self.expected._feature_probdist.items():
+            for value in (True, False):
+                assert classifier._feature_probdist[key].prob(value) == \
+                    probdist.prob(value)
+
+    def test_to_scorer(self):
+        """ Test that the counted scorer equals the compiled classifier. """
+        scorer = self.counts.to_scorer()
+        expected = naive_bayes.NaiveBayesScorer.from_classifier(
+            self.expected, self.counts.word_counts)
+        assert scorer.labels == expected.labels
+        assert scorer.vocabulary == expected.vocabulary
+        assert numpy.allclose(scorer.log_priors, expected.log_priors)
+        assert numpy.allclose(scorer.present, expected.present)
+        assert numpy.allclose(scorer.absent, expected.absent)
+
+    def test_from_classifier(self):
+        """ Test that the compiled scorer gives the classifier's labels. """
+        scorer = naive_bayes.NaiveBayesScorer.from_classifier(self.expected)
+        docs = [["love"], ["mad", "sweet"], ["unknown"], [],
+                ["hate", "happy", "love"], ["love", "love", "mad"]]
+        assert scorer.classify_many(docs) == \
+            [self.expected.classify(full_features(doc)) for doc in docs]
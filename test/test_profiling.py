@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Tests for the module profiling. """
+from unittest import mock, TestCase
+import os
+import pstats
+import tempfile
+import profiling
+
+
+def request(headers=None, args=None):
+    """ Return a fake flask request with headers and query parameters. """
+    return mock.Mock(headers=headers or {}, args=args or {})
+
+
+class ProfilingTestCase(TestCase):
+
+    """ This class has test-methods for the profiling module. """
+
+    def test_wanted(self):
+        """ Test profiling the requests asking for it and sampled ones. """
+        token = "s3cret"
+        assert profiling.wanted(request(headers={"X-Profile": token}),
+                                token=token)
+        assert profiling.wanted(request(args={"profile": token}),
+                                token=token)
+        assert not profiling.wanted(request(headers={"X-Profile": "1"}),
+                                    token=token)
+        assert not profiling.wanted(request(args={"profile": ""}),
+                                    token=token)
+        assert not profiling.wanted(request(headers={"X-Profile": "1"}))
+        assert not profiling.wanted(request())
+        sampled = [profiling.wanted(request(), sample_every=3)
+                   for _ in range(9)]
+        assert sampled.count(True) == 3
+
+    def test_run_keeps_newest_profiles(self):
+        """ Test that the profiles are pstats files, the oldest removed. """
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(5):
+                result, path = profiling.run(lambda: sum(range(1000)),
+                                             directory, "video", keep=3)
+                assert result == 499500
+                os.utime(path, (i, i))
+                paths.append(path)
+            assert sorted(os.listdir(directory)) == \
+                sorted(os.path.basename(path) for path in paths[2:])
+            stats = pstats.Stats(paths[-1])
+            assert stats.total_calls > 0
+
+    def test_run_one_profile_at_a_time(self):
+        """ Test that a function is not profiled while another one is. """
+        with tempfile.TemporaryDirectory() as directory:
+            def inner():
+                """ Run while the outer function is profiled. """
+                return profiling.run(lambda: "inner", directory, "inner")
+
+            (result, inner_path), path = profiling.run(inner, directory,
+                                                       "outer")
+            assert (result, inner_path) == ("inner", None)
+            assert os.listdir(directory) == [os.path.basename(path)]
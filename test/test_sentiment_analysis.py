@@ -5,6 +5,11 @@
 
 """ Tests for the module sentiment_analysis. """
 from unittest import mock, TestCase
+import os
+import tempfile
+import tracemalloc
+import types
+import naive_bayes
 import sentiment_analysis
 import models
 from datetime import datetime
@@ -16,7 +21,7 @@ class SentimentAnalysisTestCase(TestCase):
 
     @mock.patch("sentiment_analysis.SentimentAnalysis._train")
     @mock.patch("sentiment_analysis.SentimentAnalysis.load_classifier")
-    @mock.patch("nltk.data.load")
+    @mock.patch("naive_bayes.NaiveBayesScorer.load")
     def test_load_classifier(self, train, load_classifier, load_data):
         """
         Test the load_classifier method.
@@ -26,7 +31,7 @@ class SentimentAnalysisTestCase(TestCase):
         :param load_data:
         :return:
         """
-        sentiment_analysis.SentimentAnalysis("data/classifier.pickle")
+        sentiment_analysis.SentimentAnalysis("data/classifier.model")
         load_classifier.assert_called()
         load_data.return_value = True
         train.assert_not_called()
@@ -44,7 +49,7 @@ class SentimentAnalysisTestCase(TestCase):
                                            content=comment,
                                            published=datetime.now()))
 
-        sa = sentiment_analysis.SentimentAnalysis("data/classifier.pickle")
+        sa = sentiment_analysis.SentimentAnalysis("data/classifier.model")
         video_sentiment, comments_sentiment = sa.classify_comments(
             comments)
         assert [com.positive for com in comments_sentiment] == [1, 0, 0, 1, 1,
@@ -64,7 +69,7 @@ class SentimentAnalysisTestCase(TestCase):
                                                       n_neg=(1-ratio),
                                                       result=""))
 
-        sa = sentiment_analysis.SentimentAnalysis("data/classifier.pickle")
+        sa = sentiment_analysis.SentimentAnalysis("data/classifier.model")
         result = []
         for object_test in test_objects:
             result.append(sa._eval(object_test))
@@ -80,26 +85,168 @@ class SentimentAnalysisTestCase(TestCase):
                                            "strong positive",
                                            "strong positive"]
 
-    @mock.patch("nltk.data.load")
+    @mock.patch("naive_bayes.NaiveBayesScorer.load")
     @mock.patch("sentiment_analysis.SentimentAnalysis._train")
-    @mock.patch("logging.Logger")
-    def test_load_wrong_file(self, nltk_load, train, logger):
+    @mock.patch("logging.Logger.warning")
+    def test_load_wrong_file(self, logger, train, scorer_load):
         """
         Test load method.
 
         tests with wrong file-name
         (or the file doesn't exist)
 
-        :param nltk_load: Mock object on nltk.load method with side_effect
-        :param train: Mock object for train method. The method is not been
-                      called
         :param logger: Mock object on logging method
+        :param train: Mock object for train method. The method is called
+                      instead of loading
+        :param scorer_load: Mock object on NaiveBayesScorer.load method with
+                            side_effect
         """
-        nltk_load.side_effect = (FileExistsError, LookupError)
+        scorer_load.side_effect = FileNotFoundError("no such file")
 
         sentiment_analysis.SentimentAnalysis(
-            "data/hello_hello.pickle")
+            "data/hello_hello.model")
 
-        logger.assert_called()
-        self.assertRaises(FileExistsError, nltk_load)
+        logger.assert_called_with("cannot load classifier: %s",
+                                  scorer_load.side_effect)
+        scorer_load.assert_called()
         train.assert_called()
+
+    @mock.patch("sentiment_analysis.SentimentAnalysis.load_classifier")
+    @mock.patch("sentiment_analysis.SentimentAnalysis.load_corpus")
+    def test_classify_comments_counts(self, load_corpus, load_classifier):
+        """
+        Test classify_comments with a classifier trained on a tiny corpus.
+
+        The corpus is not loaded when the classifier is.
+
+        :param load_corpus: Mock object for load_corpus
+        :param load_classifier: Mock object returning the classifier
+        """
+        tagged_text = [(["love", "sweet"], "positive"),
+                       (["happy", "love"], "positive"),
+                       (["hate", "mad"], "negative"),
+                       (["idiot", "mad", "talk"], "negative")]
+        counts = naive_bayes.NaiveBayesCounts()
+        for words, label in tagged_text:
+            counts.add(words, label)
+        load_classifier.return_value = counts.to_scorer()
+        sa = sentiment_analysis.SentimentAnalysis("data/classifier.model")
+
+        comments = [models.Comment(id=str(i), video_id="dQw4w9WgXcQ",
+                                   author_id="xxx", author_name="yyy",
+                                   content=content,
+                                   published=datetime.now())
+                    for i, content in enumerate(["love", "hate mad",
+                                                 "sweet happy", "idiot"])]
+        video_sentiment, comments_sentiment = sa.classify_comments(comments)
+        assert [com.positive for com in comments_sentiment] == [1, 0, 1, 0]
+        assert [com.id for com in comments_sentiment] == ["0", "1", "2", "3"]
+        assert video_sentiment.n_pos == 0.5
+        assert sa.word_list == ["happy", "hate", "idiot", "love", "mad",
+                                "sweet", "talk"]
+        load_corpus.assert_not_called()
+
+    @mock.patch("sentiment_analysis.SentimentAnalysis.load_classifier")
+    def test_load_corpus_streams_lines(self, load_classifier):
+        """
+        Test that load_corpus parses the corpus lazily.
+
+        :param load_classifier: Mock object for load_classifier
+        """
+        sa = sentiment_analysis.SentimentAnalysis("data/classifier.model")
+        load_classifier.assert_called()
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_path = os.path.join(directory, "corpus.txt")
+            with open(corpus_path, "w") as corpus_file:
+                corpus_file.write("Sentiment, SentimentText\n"
+                                  "1;I love you \n"
+                                  "0;I hate you;really\n")
+            corpus = sa.load_corpus(corpus_path, ";")
+            assert isinstance(corpus, types.GeneratorType)
+            assert list(corpus) == [("I love you", "positive"),
+                                    ("I hate you", "negative")]
+
+    def test_classify_comments_processes(self):
+        """ Test that the worker pool classifies like this process. """
+        counts = naive_bayes.NaiveBayesCounts()
+        for words, label in [(["love", "sweet"], "positive"),
+                             (["hate", "mad"], "negative")]:
+            counts.add(words, label)
+        contents = ["love", "hate mad", "sweet", "unknown", "mad"] * 3
+        comments = [models.Comment(id=str(i), video_id="dQw4w9WgXcQ",
+                                   author_id="xxx", author_name="yyy",
+                                   content=content,
+                                   published=datetime.now())
+                    for i, content in enumerate(contents)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "classifier.model")
+            counts.to_scorer().save(file_path)
+            single = sentiment_analysis.SentimentAnalysis(file_path)
+            pooled = sentiment_analysis.SentimentAnalysis(
+                file_path, processes=2, chunk_size=4)
+            try:
+                expected = single.classify_comments(comments)
+                result = pooled.classify_comments(comments)
+                assert pooled._pool is not None
+            finally:
+                pooled.close()
+
+        assert [(com.id, com.positive) for com in result[1]] == \
+            [(com.id, com.positive) for com in expected[1]]
+        assert result[0].n_pos == expected[0].n_pos
+
+    def test_classify_comments_processes_corrupt_model(self):
+        """ Test that the workers don't load the model file again. """
+        counts = naive_bayes.NaiveBayesCounts()
+        for words, label in [(["love", "sweet"], "positive"),
+                             (["hate", "mad"], "negative")]:
+            counts.add(words, label)
+        comments = [models.Comment(id=str(i), video_id="dQw4w9WgXcQ",
+                                   author_id="xxx", author_name="yyy",
+                                   content=content,
+                                   published=datetime.now())
+                    for i, content in enumerate(["love", "mad"] * 4)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "classifier.model")
+            counts.to_scorer().save(file_path)
+            pooled = sentiment_analysis.SentimentAnalysis(
+                file_path, processes=2, chunk_size=2)
+            # the workers would fail loading this file in their initializer,
+            # it replaces the file this process has memory mapped
+            with open(file_path + ".new", "wb") as model_file:
+                model_file.write(b"corrupt")
+            os.replace(file_path + ".new", file_path)
+            try:
+                _, comments_sentiment = pooled.classify_comments(comments)
+            finally:
+                pooled.close()
+
+        assert [com.positive for com in comments_sentiment] == [1, 0] * 4
+
+    @mock.patch("sentiment_analysis.SentimentAnalysis.load_classifier")
+    def test_train_traces_memory_when_asked(self, load_classifier):
+        """
+        Test that the peak memory of a training is only traced when asked.
+
+        :param load_classifier: Mock object for load_classifier
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_path = os.path.join(directory, "corpus.txt")
+            with open(corpus_path, "w") as corpus_file:
+                corpus_file.write("Sentiment;SentimentText\n"
+                                  "1;I love you\n"
+                                  "0;I hate you\n")
+            model_path = os.path.join(directory, "classifier.model")
+            untraced = sentiment_analysis.SentimentAnalysis(model_path)
+            untraced._train(corpus_path)
+            traced = sentiment_analysis.SentimentAnalysis(
+                model_path, trace_memory=True)
+            traced._train(corpus_path)
+        load_classifier.assert_called()
+        assert untraced.training_stats["peak_memory"] is None
+        assert not untraced.training_stats["traced"]
+        assert traced.training_stats["peak_memory"] > 0
+        assert traced.training_stats["traced"]
+        assert not tracemalloc.is_tracing()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Tests for the module tokenizer. """
+from unittest import mock, TestCase
+import sentiment_analysis
+import tokenizer
+
+
+class TokenizerTestCase(TestCase):
+
+    """ This class has test-methods for the tokenizer module. """
+
+    def test_tokenize(self):
+        """ Test lowercasing and dropping the stop words. """
+        assert tokenizer.tokenize("The Band played THEIR\tbest  song") == \
+            ["played", "best", "song"]
+        assert tokenizer.tokenize("") == []
+        assert isinstance(tokenizer.stop_words(), frozenset)
+        assert set(tokenizer.CUSTOM_STOP_WORDS) <= tokenizer.stop_words()
+
+    def test_tokenize_many(self):
+        """ Test that tokenize_many tokenizes each text like tokenize. """
+        texts = ["I LOVE this", "They hate it", "what a song"]
+        assert tokenizer.tokenize_many(texts) == \
+            [tokenizer.tokenize(text) for text in texts]
+        assert tokenizer.tokenize_many(iter(texts)) == \
+            tokenizer.tokenize_many(texts)
+
+    def test_training_and_inference_agree(self):
+        """ Test that corpus texts and comments are tokenized the same. """
+        text = "They LOVED the new song"
+        (words, label), = sentiment_analysis.create_tagged_text(
+            [(text, "positive")])
+        assert (words, label) == (["loved", "new", "song"], "positive")
+
+        classifier = mock.Mock()
+        sentiment_analysis._classify_contents(  # noqa # pylint: disable=protected-access
+            [text], classifier)
+        classifier.classify_many.assert_called_once_with([words])
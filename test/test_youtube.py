@@ -6,9 +6,61 @@
 """ tests for the youtube module. """
 
 from unittest import mock, TestCase
+import http.server
+import threading
 import youtube
 import models
 import requests
+import datetime
+
+
+def entry(comment_id, published="2015-01-01T00:00:00.000Z"):
+    """ Return a gdata comment entry. """
+    return {"id": {"$t": comment_id},
+            "author": [{"name": {"$t": "name"},
+                        "yt$userId": {"$t": "user"}}],
+            "content": {"$t": "content"},
+            "published": {"$t": published}}
+
+
+def paged_feed(total):
+    """
+    Return a fake Session.get serving a feed of total comments.
+
+    the comments are paged by start-index and next links like gdata
+    """
+    def get(url, params):
+        """ Return the response for the page of url and params. """
+        start = params.get("start-index", 1)
+        if url.startswith("next:"):
+            start = int(url[len("next:"):])
+        ids = range(start, min(start + youtube.PAGE_SIZE, total + 1))
+        feed = {"openSearch$totalResults": {"$t": total},
+                "entry": [entry("c{}".format(i)) for i in ids],
+                "link": []}
+        if start + youtube.PAGE_SIZE <= total:
+            feed["link"].append({"rel": "next", "href": "next:{}".format(
+                start + youtube.PAGE_SIZE)})
+        if not ids:
+            del feed["entry"]
+        response = mock.Mock()
+        response.json.return_value = {"feed": feed}
+        return response
+    return get
+
+
+class UnavailableHandler(http.server.BaseHTTPRequestHandler):
+
+    """ Handler answering every request with 503 Service Unavailable. """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Answer with 503. """
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_):
+        """ Don't log the requests. """
 
 
 class YouTubeTestCase(TestCase):
@@ -32,7 +84,8 @@ class YouTubeTestCase(TestCase):
                             published="test")
         mock_comment.return_value = iter([[cm for x in range(100)]])
         scraper.fetch_comments("dQw4w9WgXcQ", 50)
-        scraper._comment_generator.assert_called_with("dQw4w9WgXcQ")
+        scraper._comment_generator.assert_called_with("dQw4w9WgXcQ",
+                                                      since=None)
 
     @mock.patch("youtube.YouTubeScraper._comment_generator")
     def test_fetch_comments_returns_correct_over_zero(self, mock_comment):
@@ -98,17 +151,152 @@ class YouTubeTestCase(TestCase):
         mock_logger.assert_called()
 
     @mock.patch("logging.Logger.exception")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_fetchcomments_no_connection(self, mock_requests, mock_logger):
         """
         test in case of requests error.
 
         tests that connection error (requests) is logged
-        :param mock_requests : Mock object for requests.get method
+        :param mock_requests : Mock object for requests.Session.get method
         :param mock_logger : Mock object for logger
         """
         scraper = youtube.YouTubeScraper()
         mock_requests.side_effect = requests.exceptions.RequestException
         assert mock_logger.assert_called()
-        self.assertRaises(requests.exceptions.RequestException,
-                          scraper.fetch_comments, "dQw4w9WgXcQ")
+        self.assertRaises(RuntimeError, scraper.fetch_comments,
+                          "dQw4w9WgXcQ")
+
+    @mock.patch("requests.Session.get")
+    def test_fetch_comments_since_stops_at_stored(self, mock_requests):
+        """
+        test fetch_comments only fetching comments newer than a stored one.
+
+        the feed has two pages, paging stops on the first page where the
+        stored comment is reached
+        :param mock_requests: Mock object for requests.Session.get method
+        """
+        page = {"feed": {"entry": [entry("c3", "2015-01-03T00:00:00.000Z"),
+                                   entry("c2", "2015-01-02T00:00:00.000Z"),
+                                   entry("c1", "2015-01-01T00:00:00.000Z")],
+                         "link": [{"rel": "next", "href": "next page"}]}}
+        mock_requests.return_value.json.return_value = page
+        stored = models.Comment(id="c2", published=datetime.datetime(
+            2015, 1, 2))
+
+        scraper = youtube.YouTubeScraper()
+        comments = scraper.fetch_comments("dQw4w9WgXcQ", since=stored)
+        assert [comment.id for comment in comments] == ["c3"]
+        assert mock_requests.call_count == 1
+
+    @mock.patch("requests.Session.get")
+    def test_fetch_comments_concurrent_in_order(self, mock_requests):
+        """
+        test fetching the pages concurrently keeps the comments in order.
+
+        :param mock_requests: Mock object for requests.Session.get method
+        """
+        mock_requests.side_effect = paged_feed(520)
+        expected = ["c{}".format(i) for i in range(1, 521)]
+        for concurrency in (1, 4):
+            scraper = youtube.YouTubeScraper(concurrency=concurrency)
+            comments = scraper.fetch_comments("dQw4w9WgXcQ")
+            assert [comment.id for comment in comments] == expected
+        assert mock_requests.call_count == 2 * 11
+
+    @mock.patch("requests.Session.get")
+    def test_fetch_comments_request_budget(self, mock_requests):
+        """
+        test that no more than max_requests pages are fetched for a video.
+
+        :param mock_requests: Mock object for requests.Session.get method
+        """
+        mock_requests.side_effect = paged_feed(520)
+        for concurrency in (1, 4):
+            mock_requests.reset_mock()
+            scraper = youtube.YouTubeScraper(concurrency=concurrency,
+                                             max_requests=3)
+            comments = scraper.fetch_comments("dQw4w9WgXcQ")
+            assert len(comments) == 3 * youtube.PAGE_SIZE
+            assert mock_requests.call_count == 3
+
+    @mock.patch("logging.Logger.warning")
+    @mock.patch("requests.Session.get")
+    def test_fetch_comments_since_past_budget(self, mock_requests,
+                                              mock_logger):
+        """
+        test that an incremental fetch pages on to the stored comment.
+
+        the comments between the budget and the stored comment would never
+        be fetched by a later incremental fetch
+        :param mock_requests: Mock object for requests.Session.get method
+        :param mock_logger: Mock object for logger
+        """
+        mock_requests.side_effect = paged_feed(520)
+        stored = models.Comment(id="c120", published=datetime.datetime(
+            2015, 1, 1))
+        expected = ["c{}".format(i) for i in range(1, 120)]
+        for concurrency in (1, 2):
+            mock_requests.reset_mock()
+            scraper = youtube.YouTubeScraper(concurrency=concurrency,
+                                             max_requests=1)
+            comments = scraper.fetch_comments("dQw4w9WgXcQ", since=stored)
+            assert [comment.id for comment in comments] == expected
+            assert mock_requests.call_count == 3
+        mock_logger.assert_called()
+
+    @mock.patch("requests.Session.get")
+    def test_fetch_comments_unique_in_order(self, mock_requests):
+        """
+        test fetch_comments leaving out comments repeated on later pages.
+
+        :param mock_requests: Mock object for requests.Session.get method
+        """
+        pages = [{"feed": {"entry": [entry("c5"), entry("c4"), entry("c3")],
+                           "link": [{"rel": "next", "href": "page 2"}]}},
+                 {"feed": {"entry": [entry("c3"), entry("c2"), entry("c2"),
+                                     entry("c1")],
+                           "link": []}}]
+        mock_requests.return_value.json.side_effect = pages
+
+        scraper = youtube.YouTubeScraper()
+        comments = scraper.fetch_comments("dQw4w9WgXcQ")
+        assert [comment.id for comment in comments] == \
+            ["c5", "c4", "c3", "c2", "c1"]
+
+    @mock.patch("requests.Session.get")
+    def test_base_url(self, mock_requests):
+        """
+        test that the feeds are fetched from the configured base url.
+
+        :param mock_requests: Mock object for requests.Session.get method
+        """
+        mock_requests.side_effect = paged_feed(3)
+        scraper = youtube.YouTubeScraper(
+            base_url="http://localhost:8080/feeds/api/videos/")
+        scraper.fetch_comments("dQw4w9WgXcQ")
+        assert mock_requests.call_args[0][0] == \
+            "http://localhost:8080/feeds/api/videos/dQw4w9WgXcQ/comments"
+        assert youtube.YouTubeScraper().video_url == \
+            youtube.GDATA_URL + "/{0}"
+
+    def test_unavailable_gdata(self):
+        """
+        test that gdata answering 503 raises a RuntimeError.
+
+        the requests are retried before giving up
+        """
+        server = http.server.HTTPServer(("127.0.0.1", 0), UnavailableHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            scraper = youtube.YouTubeScraper(
+                retries=1, backoff=0,
+                base_url="http://127.0.0.1:{}/feeds/api/videos".format(
+                    server.server_port))
+            with self.assertRaisesRegex(RuntimeError, "could not be reached"):
+                scraper.fetch_videoinfo("dQw4w9WgXcQ")
+            with self.assertRaisesRegex(RuntimeError, "could not be reached"):
+                scraper.fetch_comments("dQw4w9WgXcQ")
+        finally:
+            server.shutdown()
+            server.server_close()